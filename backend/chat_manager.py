@@ -197,6 +197,9 @@ class ChatManager:
         if session_id in self.inactivity_warnings:
             del self.inactivity_warnings[session_id]
 
+        # Liberar janela de contexto do LLM
+        llm_service.release_session(session_id)
+
         # Salvar conversa no banco de dados
         if session.messages:
             messages_data = []
@@ -255,7 +258,7 @@ class ChatManager:
                 intents: list[str] = []
                 for msg in session.messages:
                     if msg.role == MessageRole.USER:
-                        intent = llm_service._detect_intent(msg.content)
+                        intent = llm_service.get_message_intent(msg)
                         if intent:
                             intents.append(intent)
                 duration_minutes = (
@@ -301,7 +304,7 @@ class ChatManager:
             intents = []
             for msg in session.messages:
                 if msg.role == MessageRole.USER:
-                    intent = llm_service._detect_intent(msg.content)
+                    intent = llm_service.get_message_intent(msg)
                     if intent:
                         intents.append(intent)
 
@@ -468,7 +471,7 @@ class ChatManager:
         # Detectar intenções principais
         intents = []
         for msg in user_messages:
-            intent = llm_service._detect_intent(msg.content)
+            intent = llm_service.get_message_intent(msg)
             if intent:
                 intents.append(intent)
 
@@ -498,6 +501,7 @@ class ChatManager:
 
         for session_id in expired_sessions:
             del self.sessions[session_id]
+            llm_service.release_session(session_id)
 
         return len(expired_sessions)
 
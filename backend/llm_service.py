@@ -3,17 +3,26 @@ Serviço de LLM usando Google Gemini
 /-HALL-DEV Backend
 """
 
+import asyncio
 import hashlib
 import json
 import logging
 import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
 import uuid
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any
+from typing import Any, TypeVar
 
 import google.generativeai as genai
 from dotenv import load_dotenv
+from pydantic_core import to_json
 
 from schemas import (
     ChatMessage,
@@ -26,17 +35,47 @@ from schemas import (
 # Configurar logger
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
 
+class _CacheEntry:
+    """Entrada imutável do cache: resposta serializada (JSON em bytes) + horário"""
+
+    __slots__ = ("payload", "timestamp")
+
+    def __init__(self, payload: bytes, timestamp: datetime):
+        self.payload = payload
+        self.timestamp = timestamp
+
+
 class LLMCache:
     """Sistema de cache para respostas do LLM"""
 
     def __init__(self, max_size: int = 1000, ttl_hours: int = 24):
-        self.cache: OrderedDict[str, dict] = OrderedDict()
+        self.cache: OrderedDict[str, _CacheEntry] = OrderedDict()
         self.max_size = max_size
         self.ttl = timedelta(hours=ttl_hours)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_message(message: str) -> str:
+        """Normaliza mensagem: casefold, sem acentos, espaços colapsados"""
+        decomposed = unicodedata.normalize("NFKD", message.casefold())
+        without_accents = "".join(
+            ch for ch in decomposed if not unicodedata.combining(ch)
+        )
+        return re.sub(r"\s+", " ", without_accents).strip(" .!?")
+
+    def _generate_semantic_key(
+        self, user_message: str, phase: str | None, has_profile: bool
+    ) -> str:
+        """Gera chave baseada na mensagem normalizada, fase e presença de perfil"""
+        combined = f"{phase}:{int(has_profile)}:{self.normalize_message(user_message)}"
+        return hashlib.sha256(combined.encode()).hexdigest()
 
     def _generate_key(self, messages: list[dict], user_message: str) -> str:
         """Gera chave única para cache baseada no contexto e mensagem"""
@@ -45,15 +84,22 @@ class LLMCache:
         return hashlib.sha256(combined.encode()).hexdigest()
 
     def get(self, key: str) -> LLMResponse | None:
-        """Recupera resposta do cache"""
+        """
+        Recupera resposta do cache
+
+        Cada chamada reconstrói um LLMResponse novo a partir do payload
+        congelado, então o chamador pode alterá-lo sem afetar outras sessões.
+        """
         if key in self.cache:
             cached = self.cache[key]
-            if datetime.now() - cached["timestamp"] < self.ttl:
+            if datetime.now() - cached.timestamp < self.ttl:
                 # Mover para o final (LRU)
                 self.cache.move_to_end(key)
-                return cached["response"]
+                self.hits += 1
+                return LLMResponse.model_validate_json(cached.payload)
             else:
                 del self.cache[key]
+        self.misses += 1
         return None
 
     def set(self, key: str, response: LLMResponse):
@@ -62,27 +108,859 @@ class LLMCache:
             # Remove item mais antigo (primeiro da OrderedDict) - O(1)
             self.cache.popitem(last=False)
 
-        self.cache[key] = {"response": response, "timestamp": datetime.now()}
+        self.cache[key] = _CacheEntry(to_json(response), datetime.now())
         # Mover para o final (LRU)
         self.cache.move_to_end(key)
 
+    async def aget(self, key: str) -> LLMResponse | None:
+        """Versão assíncrona de get (em memória não bloqueia o event loop)"""
+        return self.get(key)
+
+    async def aset(self, key: str, response: LLMResponse):
+        """Versão assíncrona de set (em memória não bloqueia o event loop)"""
+        self.set(key, response)
+
     def clear_expired(self):
         """Remove itens expirados do cache"""
         current_time = datetime.now()
         expired_keys = [
             key
             for key, value in self.cache.items()
-            if current_time - value["timestamp"] > self.ttl
+            if current_time - value.timestamp > self.ttl
         ]
         for key in expired_keys:
             del self.cache[key]
 
+    def clear(self):
+        """Remove todos os itens do cache"""
+        self.cache.clear()
+
+    def evict_oldest(self, count: int):
+        """Remove os `count` itens usados há mais tempo"""
+        for _ in range(min(count, len(self.cache))):
+            self.cache.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
     def get_stats(self) -> dict:
         """Retorna estatísticas do cache"""
+        lookups = self.hits + self.misses
         return {
-            "size": len(self.cache),
+            "backend": "memory",
+            "size": len(self),
             "max_size": self.max_size,
             "ttl_hours": self.ttl.total_seconds() / 3600,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SQLiteLLMCache(LLMCache):
+    """
+    Cache persistente de respostas do LLM em SQLite (modo WAL)
+
+    Mesma semântica LRU+TTL do LLMCache, mas compartilhado entre workers e
+    preservado entre reinícios/deploys. Cada thread mantém sua conexão; aget e
+    aset rodam num executor próprio para que o busy timeout do SQLite não
+    trave o event loop. O limite de tamanho é aplicado a cada
+    LLM_CACHE_TRIM_EVERY escritas, não a cada set.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        table: str = "llm_cache",
+        max_size: int = 1000,
+        ttl_hours: int = 24,
+    ):
+        super().__init__(max_size=max_size, ttl_hours=ttl_hours)
+        self.db_path = db_path
+        self.table = table
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"{table}-sqlite"
+        )
+        self.trim_every = max(1, int(os.getenv("LLM_CACHE_TRIM_EVERY", "50")))
+        self._writes = 0
+        self._init_table()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexão da thread atual (criada sob demanda)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_table(self):
+        """Cria a tabela do cache se necessário"""
+        conn = self._connection()
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{self.table}_last_access "
+            f"ON {self.table}(last_access)"
+        )
+
+    def get(self, key: str) -> LLMResponse | None:
+        """Recupera resposta do cache persistente"""
+        conn = self._connection()
+        row = conn.execute(
+            f"SELECT payload, created_at FROM {self.table} WHERE key = ?",  # noqa: S608
+            (key,),
+        ).fetchone()
+        now = time.time()
+        if row:
+            payload, created_at = row
+            if now - created_at < self.ttl.total_seconds():
+                conn.execute(
+                    f"UPDATE {self.table} SET last_access = ? WHERE key = ?",  # noqa: S608
+                    (now, key),
+                )
+                self.hits += 1
+                return LLMResponse.model_validate_json(payload)
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))  # noqa: S608
+        self.misses += 1
+        return None
+
+    def set(self, key: str, response: LLMResponse):
+        """Armazena resposta e aplica o limite de tamanho (LRU)"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} "  # noqa: S608
+            "(key, payload, created_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, to_json(response), now, now),
+        )
+        self._writes += 1
+        if self._writes % self.trim_every == 0:
+            self.trim()
+
+    def trim(self):
+        """Mantém apenas os `max_size` itens usados mais recentemente"""
+        self._connection().execute(
+            f"DELETE FROM {self.table} WHERE key NOT IN ("  # noqa: S608
+            f"SELECT key FROM {self.table} ORDER BY last_access DESC LIMIT ?)",
+            (self.max_size,),
+        )
+
+    async def aget(self, key: str) -> LLMResponse | None:
+        """Recupera resposta fora do event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.get, key)
+
+    async def aset(self, key: str, response: LLMResponse):
+        """Armazena resposta fora do event loop"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.set, key, response)
+
+    def clear_expired(self):
+        """Remove itens expirados do cache"""
+        cutoff = time.time() - self.ttl.total_seconds()
+        self._connection().execute(
+            f"DELETE FROM {self.table} WHERE created_at <= ?",  # noqa: S608
+            (cutoff,),
+        )
+
+    def clear(self):
+        """Remove todos os itens do cache"""
+        self._connection().execute(f"DELETE FROM {self.table}")  # noqa: S608
+
+    def evict_oldest(self, count: int):
+        """Remove os `count` itens usados há mais tempo"""
+        self._connection().execute(
+            f"DELETE FROM {self.table} WHERE key IN ("  # noqa: S608
+            f"SELECT key FROM {self.table} ORDER BY last_access LIMIT ?)",
+            (count,),
+        )
+
+    def __len__(self) -> int:
+        row = self._connection().execute(
+            f"SELECT COUNT(*) FROM {self.table}"  # noqa: S608
+        ).fetchone()
+        return row[0]
+
+    def get_stats(self) -> dict:
+        """Retorna estatísticas do cache"""
+        return {**super().get_stats(), "backend": "sqlite", "db_path": self.db_path}
+
+
+def create_llm_cache(table: str, max_size: int, ttl_hours: int) -> LLMCache:
+    """
+    Cria o cache de respostas conforme LLM_CACHE_BACKEND
+
+    "memory" (padrão): por processo. "sqlite": persistente em
+    LLM_CACHE_DB_PATH, compartilhado entre workers e deploys.
+    """
+    backend = os.getenv("LLM_CACHE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        db_path = os.getenv("LLM_CACHE_DB_PATH", "llm_cache.db")
+        try:
+            return SQLiteLLMCache(
+                db_path, table=table, max_size=max_size, ttl_hours=ttl_hours
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Cache SQLite indisponível ({e}); usando memória")
+    return LLMCache(max_size=max_size, ttl_hours=ttl_hours)
+
+
+# Palavras-chave por intenção, em ordem de prioridade
+INTENT_KEYWORDS: dict[str, list[str]] = {
+    "greeting": ["olá", "oi", "bom dia", "boa tarde", "boa noite"],
+    "mentoring": ["mentoria", "mentor"],
+    "learning": ["aprender", "estudar", "curso", "treinamento", "formação"],
+    "programming": [
+        "programar",
+        "programação",
+        "código",
+        "desenvolver",
+        "coding",
+    ],
+    "self_learning": [
+        "sozinho",
+        "autodidata",
+        "independente",
+        "por conta própria",
+    ],
+    "help_request": ["ajudar", "ajuda", "suporte", "assistência"],
+    "problem_description": [
+        "problema",
+        "dificuldade",
+        "dor",
+        "preciso",
+        "quero",
+    ],
+    "service_inquiry": ["serviço", "solução", "desenvolvimento", "software"],
+    "contact_info": ["contato", "email", "telefone", "whatsapp"],
+    "pricing": ["preço", "valor", "custo", "orçamento"],
+    "technical": ["tecnologia", "programação", "código", "sistema"],
+}
+
+# Palavra-chave -> (prioridade, intenção); a 1ª intenção da lista prevalece
+_KEYWORD_INTENTS: dict[str, tuple[int, str]] = {}
+for _priority, (_intent, _keywords) in enumerate(INTENT_KEYWORDS.items()):
+    for _keyword in _keywords:
+        _KEYWORD_INTENTS.setdefault(_keyword, (_priority, _intent))
+
+# Alternação única com limites de palavra (aceita plural simples)
+_INTENT_PATTERN = re.compile(
+    r"\b("
+    + "|".join(re.escape(k) for k in sorted(_KEYWORD_INTENTS, key=len, reverse=True))
+    + r")s?\b"
+)
+
+
+def classify_intent(message: str) -> str | None:
+    """Classifica a intenção em uma única varredura da mensagem"""
+    best: tuple[int, str] | None = None
+    for match in _INTENT_PATTERN.finditer(message.lower()):
+        candidate = _KEYWORD_INTENTS[match.group(1)]
+        if best is None or candidate < best:
+            best = candidate
+            if best[0] == 0:
+                break
+    return best[1] if best else None
+
+
+# Extração de perfil: uma única regex compilada na importação
+_LETTERS = r"[A-Za-zÀ-ÖØ-öø-ÿ]"
+# Palavras que encerram um nome/empresa/cargo ("meu nome é Ana e trabalho...",
+# "sou Ana da empresa X")
+_PHRASE_STOP = (
+    r"(?!(?:e|na|no|em|mas|meu|minha|sou|trabalho|atuo|com|como|para|que|"
+    r"há|desde|faz|email|e-mail|aqui|(?:da|do|de)\s+empresa)\b)"
+)
+_NAME = rf"{_LETTERS}+(?:\s+{_PHRASE_STOP}{_LETTERS}+){{0,3}}"
+_PHRASE = rf"[\wÀ-ÖØ-öø-ÿ&-]+(?:\s+{_PHRASE_STOP}[\wÀ-ÖØ-öø-ÿ&-]+){{0,3}}"
+_ROLE_TITLES = (
+    "gerente|diretora?|ceo|cto|cfo|coo|desenvolvedora?|programadora?|"
+    "analista|engenheira?|engenheiro|coordenadora?|fundadora?|sócia?|sócio|"
+    "dona?|dono|estudante|consultora?|supervisora?|assistente|"
+    "proprietária?|proprietário|empresária?|empresário|presidente"
+)
+# Depois de "sou"/"eu sou": descrições, não nomes ("eu sou muito curioso")
+_NOT_NAMES = (
+    "muito|bem|mais|meio|bastante|apenas|só|novo|nova|novato|novata|"
+    "iniciante|curiosa?|curioso|interessada?|interessado|cliente|leigo|leiga|"
+    "responsável|autônoma?|autônomo|freelancer"
+)
+_PROFILE_PATTERN = re.compile(
+    # \b fatorado para fora da alternância: só posições de início de palavra
+    r"\b(?:(?P<email>[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b)"
+    # Cargo antes do nome: "sou gerente" não é um nome
+    rf"|(?:eu sou|sou|atuo como|trabalho como|como)\s+(?:o\s+|a\s+|um\s+|uma\s+)?"
+    rf"(?P<role>(?:{_ROLE_TITLES})\b(?:\s+(?:de|do|da)\s+(?!(?:empresa|um|uma|o|a)\b){_LETTERS}+)?)"
+    rf"|meu cargo (?:é|e)\s+(?P<role2>{_PHRASE})"
+    rf"|(?:trabalho|atuo)\s+(?:na|no|em|pela|pelo)\s+(?:empresa\s+)?(?P<company>{_PHRASE})"
+    rf"|(?:minha|na|da|de|pela|a) empresa\s+(?:(?:é|se chama)\s+)?(?P<company2>{_PHRASE})"
+    rf"|(?:meu nome (?:é|e)|eu sou|chamo-me|me chamo|sou)\s+"
+    rf"(?:o\s+|a\s+)?(?!(?:de|da|do|um|uma|{_ROLE_TITLES}|{_NOT_NAMES})\b)"
+    rf"(?P<name>{_NAME}))",
+    re.IGNORECASE,
+)
+# Toda alternativa da regex contém um destes trechos: mensagens sem nenhum
+# deles (a maioria no chat) dispensam a varredura
+_PROFILE_HINTS = (
+    "@", "sou", "nome", "cham", "trabalho", "atuo", "empresa", "cargo", "como"
+)
+_PROFILE_GROUPS = {
+    "email": "email",
+    "role": "role",
+    "role2": "role",
+    "company": "company",
+    "company2": "company",
+    "name": "name",
+}
+
+
+def extract_user_profile(message: str) -> dict[str, str] | None:
+    """
+    Extrai nome, email, empresa e cargo em uma única varredura
+
+    Returns:
+        Dicionário pronto para ChatManager.update_user_profile ou None
+    """
+    lowered = message.lower()
+    if not any(hint in lowered for hint in _PROFILE_HINTS):
+        return None
+    profile: dict[str, str] = {}
+    for match in _PROFILE_PATTERN.finditer(message):
+        field = _PROFILE_GROUPS[match.lastgroup]
+        if field in profile:
+            continue
+        value = match.group(match.lastgroup).strip()
+        profile[field] = value.title() if field == "name" else value
+    return profile or None
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa local de tokens (~4 caracteres por token)"""
+    return (len(text) + 3) // 4
+
+
+def _is_user_message(message: ChatMessage | dict, content: str) -> bool:
+    """Verifica se a mensagem (ChatMessage ou dict) é do usuário com esse conteúdo"""
+    if isinstance(message, dict):
+        role, text = message.get("role"), message.get("content")
+    else:
+        role, text = message.role, message.content
+    return role in (MessageRole.USER, "user") and text == content
+
+
+class ConversationWindow:
+    """
+    Janela de contexto de uma sessão limitada por orçamento de tokens
+
+    Mantida incrementalmente: a cada turno apenas as mensagens novas são
+    anexadas. Mensagens que saem da janela viram linhas de um resumo rolante.
+    """
+
+    SUMMARY_LINE_CHARS = 160
+
+    def __init__(self, token_budget: int, summary_max_chars: int):
+        self.token_budget = token_budget
+        self.summary_max_chars = summary_max_chars
+        self._reset()
+
+    def _reset(self):
+        self.entries: deque[dict[str, str]] = deque()
+        self.entry_tokens: deque[int] = deque()
+        self.tokens = 0
+        self.seen = 0  # Mensagens da sessão já incorporadas
+        self.summary_lines: deque[str] = deque()
+        self.summary_chars = 0
+
+    def sync(self, messages: list[ChatMessage | dict]):
+        """Anexa apenas as mensagens ainda não vistas da sessão"""
+        if len(messages) < self.seen:
+            # Histórico diferente do acompanhado: recomeçar
+            self._reset()
+        for message in messages[self.seen :]:
+            if isinstance(message, dict):
+                role, content = message.get("role"), message.get("content", "")
+            else:
+                role, content = message.role, message.content
+            role = role.value if isinstance(role, MessageRole) else str(role)
+            self._append(role, content)
+        self.seen = len(messages)
+
+    def _append(self, role: str, content: str):
+        tokens = estimate_tokens(content)
+        if tokens > self.token_budget:
+            # Mensagem gigante (texto colado): manter apenas o início
+            content = content[: (self.token_budget - 2) * 4] + " [...]"
+            tokens = estimate_tokens(content)
+        self.entries.append({"role": role, "content": content})
+        self.entry_tokens.append(tokens)
+        self.tokens += tokens
+
+        while self.tokens > self.token_budget and len(self.entries) > 1:
+            evicted = self.entries.popleft()
+            self.tokens -= self.entry_tokens.popleft()
+            self._summarize(evicted)
+
+    def _summarize(self, message: dict[str, str]):
+        """Incorpora a mensagem removida ao resumo rolante"""
+        label = "Usuário" if message["role"] == "user" else "Assistente"
+        text = " ".join(message["content"].split())[: self.SUMMARY_LINE_CHARS]
+        line = f"{label}: {text}"
+        self.summary_lines.append(line)
+        self.summary_chars += len(line)
+        while self.summary_chars > self.summary_max_chars and len(self.summary_lines) > 1:
+            self.summary_chars -= len(self.summary_lines.popleft())
+
+    @property
+    def summary(self) -> str:
+        return "\n".join(self.summary_lines)
+
+    def history(self) -> list[dict[str, str]]:
+        """
+        Histórico para o Gemini: resumo + janela
+
+        A mensagem atual não entra na janela (ver LLMService._prepare_context):
+        ela é enviada à parte, inteira, por send_message.
+        """
+        history = list(self.entries)
+        if self.summary_lines:
+            history.insert(
+                0,
+                {
+                    "role": "user",
+                    "content": f"[Resumo das mensagens anteriores]\n{self.summary}",
+                },
+            )
+        return history
+
+
+class RateLimitExceededError(Exception):
+    """Limite de requisições excedido; retry_after em segundos"""
+
+    def __init__(self, retry_after: float, scope: str):
+        super().__init__(f"Rate limit excedido ({scope})")
+        self.retry_after = retry_after
+        self.scope = scope
+
+
+class TokenBucketRateLimiter:
+    """
+    Rate limiting por token bucket, por cliente (IP e sessão) e global
+
+    Cada verificação é O(1): os buckets ficam em um OrderedDict ordenado pelo
+    último uso e buckets ociosos (já cheios de novo) são descartados pela frente.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        burst: int,
+        global_rate_per_minute: float,
+        global_burst: int,
+    ):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.global_rate = global_rate_per_minute / 60
+        self.global_burst = global_burst
+        # Tempo para um bucket voltar a ficar cheio: depois disso pode ser descartado
+        self.idle_ttl = max(burst / self.rate, 60.0)
+        self.buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self.global_bucket = [float(global_burst), time.monotonic()]
+        self.allowed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _refill(bucket: list[float], rate: float, capacity: int, now: float):
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+
+    def _expire_idle(self, now: float):
+        """Descarta buckets ociosos a partir do menos recente"""
+        while self.buckets:
+            key, bucket = next(iter(self.buckets.items()))
+            if now - bucket[1] < self.idle_ttl:
+                break
+            del self.buckets[key]
+
+    def acquire(self, keys: list[str]):
+        """
+        Consome um token de cada bucket do cliente e do bucket global
+
+        Raises:
+            RateLimitExceededError: Se algum bucket estiver vazio
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire_idle(now)
+
+            client_buckets = []
+            for key in keys:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = [float(self.burst), now]
+                    self.buckets[key] = bucket
+                else:
+                    self._refill(bucket, self.rate, self.burst, now)
+                    self.buckets.move_to_end(key)
+                client_buckets.append((key, bucket))
+            self._refill(
+                self.global_bucket, self.global_rate, self.global_burst, now
+            )
+
+            for key, bucket in client_buckets:
+                if bucket[0] < 1:
+                    self.rejected += 1
+                    raise RateLimitExceededError((1 - bucket[0]) / self.rate, key)
+            if self.global_bucket[0] < 1:
+                self.rejected += 1
+                raise RateLimitExceededError(
+                    (1 - self.global_bucket[0]) / self.global_rate, "global"
+                )
+
+            for _, bucket in client_buckets:
+                bucket[0] -= 1
+            self.global_bucket[0] -= 1
+            self.allowed += 1
+
+    def get_stats(self) -> dict:
+        """Retorna estatísticas do rate limiter"""
+        return {
+            "client_rate_per_minute": self.rate * 60,
+            "client_burst": self.burst,
+            "global_rate_per_minute": self.global_rate * 60,
+            "global_burst": self.global_burst,
+            "global_tokens_available": round(self.global_bucket[0], 2),
+            "tracked_buckets": len(self.buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+
+class SingleFlight:
+    """
+    Deduplica chamadas idênticas em andamento (single-flight)
+
+    A primeira chamada para uma chave executa a operação; as que chegarem
+    enquanto ela está em andamento aguardam e recebem o mesmo resultado.
+    """
+
+    def __init__(self):
+        self.inflight: dict[str, asyncio.Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """
+        Executa `factory` uma única vez por chave em andamento
+
+        Returns:
+            Tupla (resultado, compartilhado) - compartilhado=True se o resultado
+            veio de outra chamada em andamento
+        """
+        while True:
+            future = self.inflight.get(key)
+            if future is None:
+                break
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Se a chamada original foi cancelada, tentar novamente
+                if not future.cancelled():
+                    raise
+                continue
+            self.coalesced += 1
+            return result, True
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        self.executed += 1
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marca a exceção como consumida mesmo sem chamadas aguardando
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self.inflight.pop(key, None)
+
+    def get_stats(self) -> dict:
+        """Retorna estatísticas de deduplicação"""
+        return {
+            "inflight": len(self.inflight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
+
+
+class GeminiModelRegistry:
+    """Registro LRU de GenerativeModel por variante de prompt e política"""
+
+    def __init__(self, model_name: str, max_size: int = 32):
+        self.model_name = model_name
+        self.models: OrderedDict[tuple[str, str], genai.GenerativeModel] = (
+            OrderedDict()
+        )
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self, variant: str, policy: str, build_instruction: Callable[[], str]
+    ) -> genai.GenerativeModel:
+        """
+        Recupera o modelo da variante/política, construindo-o apenas na 1ª vez
+
+        Args:
+            variant: Variante do prompt de sistema (ex.: "default", "mentoring")
+            policy: Instruções de política anexadas ao prompt
+            build_instruction: Gera a system instruction completa em caso de miss
+
+        Returns:
+            GenerativeModel reutilizável entre requisições
+        """
+        key = (variant, policy)
+        model = self.models.get(key)
+        if model is not None:
+            self.hits += 1
+            self.models.move_to_end(key)
+            return model
+
+        self.misses += 1
+        model = genai.GenerativeModel(
+            self.model_name, system_instruction=build_instruction()
+        )
+        if len(self.models) >= self.max_size:
+            # Remove modelo menos usado recentemente - O(1)
+            self.models.popitem(last=False)
+        self.models[key] = model
+        return model
+
+    def clear(self):
+        """Descarta os modelos registrados"""
+        self.models.clear()
+
+    def get_stats(self) -> dict:
+        """Retorna estatísticas do registro"""
+        return {
+            "size": len(self.models),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CircuitOpenError(Exception):
+    """Circuito aberto: Gemini degradado; retry_after em segundos"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Circuit breaker aberto para o Gemini")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker com sondagem half-open
+
+    closed: chamadas passam; após `failure_threshold` falhas consecutivas abre.
+    open: chamadas falham imediatamente até `recovery_timeout` expirar.
+    half_open: uma única chamada de sondagem passa; sucesso fecha o circuito,
+    falha reabre.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+        self.short_circuited = 0
+        self.successes = 0
+        self.failures = 0
+
+    def before_call(self):
+        """
+        Autoriza uma chamada ao Gemini
+
+        Raises:
+            CircuitOpenError: Se o circuito estiver aberto ou já houver sondagem
+        """
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.recovery_timeout:
+                self.short_circuited += 1
+                raise CircuitOpenError(self.recovery_timeout - elapsed)
+            self.state = self.HALF_OPEN
+        if self.probe_in_flight:
+            self.short_circuited += 1
+            raise CircuitOpenError(self.recovery_timeout)
+        self.probe_in_flight = True
+
+    def record_success(self):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+        if self.state != self.CLOSED:
+            logger.info("Circuit breaker do Gemini fechado")
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if (
+            self.state == self.HALF_OPEN
+            or self.consecutive_failures >= self.failure_threshold
+        ):
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(
+                    f"Circuit breaker do Gemini aberto por {self.recovery_timeout}s "
+                    f"({self.consecutive_failures} falhas consecutivas)"
+                )
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self):
+        """Chamada cancelada pelo cliente: libera a sondagem sem contar falha"""
+        self.probe_in_flight = False
+
+    def get_stats(self) -> dict:
+        """Retorna estado e contadores do circuito"""
+        retry_after = 0.0
+        if self.state == self.OPEN:
+            retry_after = max(
+                0.0, self.recovery_timeout - (time.monotonic() - self.opened_at)
+            )
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_timeout": self.recovery_timeout,
+            "retry_after": round(retry_after, 2),
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited,
+            "successes": self.successes,
+            "failures": self.failures,
+        }
+
+
+class HedgedCaller:
+    """
+    Requisições com hedge: se a chamada original passar do p95 de latência
+    observado, uma duplicata é disparada e vence a que responder primeiro
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        min_delay: float,
+        min_samples: int = 20,
+        percentile: float = 0.95,
+        window: int = 200,
+    ):
+        self.enabled = enabled
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+
+    def record_latency(self, seconds: float):
+        self.latencies.append(seconds)
+
+    def hedge_delay(self) -> float | None:
+        """Atraso antes do hedge (p95 observado) ou None sem amostras suficientes"""
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return max(self.min_delay, ordered[index])
+
+    async def call(self, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Executa `factory`; com hedge habilitado dispara uma segunda chamada
+        após o p95 e retorna o primeiro resultado bem-sucedido
+        """
+        self.calls += 1
+        delay = self.hedge_delay() if self.enabled else None
+        start = time.monotonic()
+        primary = asyncio.ensure_future(factory())
+        if delay is None:
+            result = await primary
+            self.record_latency(time.monotonic() - start)
+            return result
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges_sent += 1
+                tasks.add(asyncio.ensure_future(factory()))
+            while True:
+                done, pending = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                # Consultar exception() de todas marca os erros como tratados
+                succeeded = [t for t in done if t.exception() is None]
+                winner = succeeded[0] if succeeded else None
+                if winner is not None or not pending:
+                    break
+                # Uma das chamadas falhou: aguardar a outra
+                tasks = pending
+            if winner is None:
+                # Todas falharam: propagar o erro da chamada original se houver
+                failed = primary if primary in done else next(iter(done))
+                return failed.result()
+            if winner is not primary:
+                self.hedge_wins += 1
+            self.record_latency(time.monotonic() - start)
+            return winner.result()
+        finally:
+            for task in tasks | {primary}:
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> dict:
+        """Retorna estatísticas de latência e de hedges"""
+        delay = self.hedge_delay()
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "hedges_sent": self.hedges_sent,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": (
+                round(self.hedge_wins / self.hedges_sent, 3)
+                if self.hedges_sent
+                else 0.0
+            ),
+            "p95_delay": round(delay, 3) if delay is not None else None,
+            "latency_samples": len(self.latencies),
         }
 
 
@@ -102,12 +980,58 @@ class LLMService:
         self.temperature = 0.25
 
         # Cache de respostas
-        self.cache = LLMCache(max_size=500, ttl_hours=12)
+        self.cache = create_llm_cache("llm_cache", max_size=500, ttl_hours=12)
+
+        # Janelas de contexto por sessão, limitadas por tokens estimados
+        self.context_token_budget = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "2000"))
+        self.summary_max_chars = int(os.getenv("LLM_SUMMARY_MAX_CHARS", "1200"))
+        self.max_windows = int(os.getenv("LLM_MAX_CONTEXT_WINDOWS", "1000"))
+        self.windows: OrderedDict[str, ConversationWindow] = OrderedDict()
+        self.token_stats = {"requests": 0, "tokens_in": 0, "tokens_out": 0}
+
+        # Deduplicação de chamadas idênticas em andamento
+        self.single_flight = SingleFlight()
+
+        # Cache de 2º nível: primeiras mensagens normalizadas (entre sessões)
+        self.semantic_cache = create_llm_cache(
+            "llm_semantic_cache", max_size=200, ttl_hours=12
+        )
+
+        # Modelos reutilizados por variante de prompt + política
+        self.model_registry = GeminiModelRegistry(
+            self.model_name,
+            max_size=int(os.getenv("LLM_MODEL_REGISTRY_SIZE", "32")),
+        )
+
+        # Rate limiting por cliente (IP + sessão) com teto global
+        self.rate_limiter = TokenBucketRateLimiter(
+            rate_per_minute=float(os.getenv("LLM_RATE_LIMIT_PER_MINUTE", "20")),
+            burst=int(os.getenv("LLM_RATE_LIMIT_BURST", "5")),
+            global_rate_per_minute=float(
+                os.getenv("LLM_GLOBAL_RATE_LIMIT_PER_MINUTE", "60")
+            ),
+            global_burst=int(os.getenv("LLM_GLOBAL_RATE_LIMIT_BURST", "20")),
+        )
+
+        # Chamadas assíncronas ao Gemini (não bloqueiam o event loop)
+        self.request_timeout = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+        self.max_concurrent_requests = int(
+            os.getenv("LLM_MAX_CONCURRENT_REQUESTS", "16")
+        )
+        self._gemini_semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        self.inflight_requests = 0
+
+        # Falha rápida enquanto o Gemini estiver degradado
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5")),
+            recovery_timeout=float(os.getenv("LLM_BREAKER_RECOVERY_SECONDS", "30")),
+        )
 
-        # Rate limiting
-        self.request_count = 0
-        self.last_reset = datetime.now()
-        self.max_requests_per_minute = 60
+        # Hedge opcional após o p95 de latência para cortar a cauda
+        self.hedger = HedgedCaller(
+            enabled=os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true",
+            min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "2")),
+        )
 
         # Personalidade do agente
         self.system_prompt = """Você é um agente conversacional especializado da /-HALL-DEV.
@@ -137,31 +1061,32 @@ REGRAS GERAIS:
 - Priorize avançar o fluxo (coleta e agendamento)
 """
 
-    def _check_rate_limit(self) -> bool:
-        """Verifica se não excedeu o rate limit"""
-        current_time = datetime.now()
-
-        # Reset contador a cada minuto
-        if current_time - self.last_reset > timedelta(minutes=1):
-            self.request_count = 0
-            self.last_reset = current_time
-
-        if self.request_count >= self.max_requests_per_minute:
-            return False
-
-        self.request_count += 1
-        return True
-
-    def _build_conversation_context(
-        self, messages: list[ChatMessage]
-    ) -> list[dict[str, str]]:
-        """Constrói o contexto da conversa para o LLM"""
-        context = [{"role": "system", "content": self.system_prompt}]
-
-        for message in messages:
-            context.append({"role": message.role.value, "content": message.content})
-
-        return context
+    def check_rate_limit(self, session_id: str, client_ip: str | None = None):
+        """
+        Verifica o rate limit do cliente antes de processar a mensagem
+
+        Raises:
+            RateLimitExceededError: Se o cliente ou o teto global excederem o limite
+        """
+        keys = [f"session:{session_id}"]
+        if client_ip:
+            keys.append(f"ip:{client_ip}")
+        self.rate_limiter.acquire(keys)
+
+    async def _send_message(self, chat: Any, message: str) -> Any:
+        """Envia mensagem ao Gemini via cliente assíncrono, limitado por semáforo"""
+        async with self._gemini_semaphore:
+            self.inflight_requests += 1
+            try:
+                return await chat.send_message_async(
+                    message,
+                    generation_config=genai.types.GenerationConfig(
+                        max_output_tokens=self.max_tokens,
+                        temperature=self.temperature,
+                    ),
+                )
+            finally:
+                self.inflight_requests -= 1
 
     def _get_phase_from_context(self, ctx: dict[str, Any] | None) -> str | None:
         if not ctx:
@@ -245,73 +1170,42 @@ REGRAS GERAIS:
 
     def _extract_user_profile(self, message: str) -> dict[str, str] | None:
         """Extrai informações do usuário da mensagem"""
-        # Lógica simples de extração - pode ser melhorada
-        profile = {}
-
-        # Extrair nome (padrões comuns)
-        import re
-
-        name_patterns = [
-            r"meu nome é\s+([\wÀ-ÖØ-öø-ÿ\s]{2,})",
-            r"eu sou\s+([\wÀ-ÖØ-öø-ÿ\s]{2,})",
-            r"chamo-me\s+([\wÀ-ÖØ-öø-ÿ\s]{2,})",
-            r"sou\s+([\wÀ-ÖØ-öø-ÿ\s]{2,})",
-        ]
-
-        for pattern in name_patterns:
-            match = re.search(pattern, message.lower())
-            if match:
-                profile["name"] = match.group(1).strip().title()
-                break
-
-        # Extrair email
-        email_pattern = r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b"
-        email_match = re.search(email_pattern, message)
-        if email_match:
-            profile["email"] = email_match.group(0)
-
-        return profile if profile else None
+        return extract_user_profile(message)
 
     def _detect_intent(self, message: str) -> str | None:
         """Detecta a intenção da mensagem do usuário"""
-        message_lower = message.lower()
-
-        intents = {
-            "greeting": ["olá", "oi", "bom dia", "boa tarde", "boa noite"],
-            "mentoring": ["mentoria", "mentor"],
-            "learning": ["aprender", "estudar", "curso", "treinamento", "formação"],
-            "programming": [
-                "programar",
-                "programação",
-                "código",
-                "desenvolver",
-                "coding",
-            ],
-            "self_learning": [
-                "sozinho",
-                "autodidata",
-                "independente",
-                "por conta própria",
-            ],
-            "help_request": ["ajudar", "ajuda", "suporte", "assistência"],
-            "problem_description": [
-                "problema",
-                "dificuldade",
-                "dor",
-                "preciso",
-                "quero",
-            ],
-            "service_inquiry": ["serviço", "solução", "desenvolvimento", "software"],
-            "contact_info": ["contato", "email", "telefone", "whatsapp"],
-            "pricing": ["preço", "valor", "custo", "orçamento"],
-            "technical": ["tecnologia", "programação", "código", "sistema"],
-        }
-
-        for intent, keywords in intents.items():
-            if any(keyword in message_lower for keyword in keywords):
-                return intent
-
-        return None
+        return classify_intent(message)
+
+    def get_message_intent(self, message: ChatMessage) -> str | None:
+        """Intenção da mensagem, calculada uma única vez e memorizada nela"""
+        if not message._intent_computed:
+            message._intent = classify_intent(message.content)
+            message._intent_computed = True
+        return message._intent
+
+    def _request_intent(self, request: LLMRequest) -> str | None:
+        """
+        Intenção da mensagem atual
+
+        A mensagem já registrada na sessão (último item do contexto) guarda a
+        intenção calculada aqui; o resumo da sessão não a recalcula.
+        """
+        messages = (request.context or {}).get("messages", []) or []
+        if (
+            messages
+            and isinstance(messages[-1], ChatMessage)
+            and _is_user_message(messages[-1], request.message)
+        ):
+            return self.get_message_intent(messages[-1])
+        return self._detect_intent(request.message)
+
+    def _get_prompt_variant(self, detected_intent: str | None) -> str:
+        """Mapeia a intenção para a variante de prompt usada em _get_contextual_prompt"""
+        if detected_intent in ["mentoring", "learning", "programming", "self_learning"]:
+            return "mentoring"
+        if detected_intent == "help_request":
+            return "help_request"
+        return "default"
 
     def _get_contextual_prompt(self, message: str, detected_intent: str | None) -> str:
         """Gera prompt contextual baseado na intenção detectada"""
@@ -480,154 +1374,430 @@ Responda de forma natural e estruturada, com 2-3 frases. Sempre aplique quebras
         else:
             return self.system_prompt
 
-    def _optimize_prompt_size(
-        self, context: list[dict[str, str]]
-    ) -> list[dict[str, str]]:
-        """Otimiza o tamanho do prompt para reduzir tokens"""
-        if len(context) <= 10:  # Se já é pequeno, retorna como está
-            return context
-
-        # Manter system prompt e últimas 8 mensagens
-        optimized = [context[0]]  # System prompt
-        optimized.extend(context[-8:])  # Últimas 8 mensagens
-
-        return optimized
-
-    async def generate_response(self, request: LLMRequest) -> LLMResponse:
-        """Gera resposta usando Groq LLM com cache e otimizações"""
-        try:
-            # Validar entrada
-            if not request.message or not request.message.strip():
-                return LLMResponse(
-                    message="Por favor, digite uma mensagem para que eu possa te ajudar.",
-                    session_id=request.session_id,
-                    confidence=0.0,
-                    metadata={"error": "empty_message"},
-                )
-
-            # Verificar rate limit
-            if not self._check_rate_limit():
-                return LLMResponse(
-                    message="Desculpe, estamos com muitas solicitações no momento. Tente novamente em alguns instantes.",
-                    session_id=request.session_id,
-                    confidence=0.0,
-                    metadata={"error": "rate_limit_exceeded"},
-                )
-
-            # Construir contexto da conversa
-            messages = (request.context or {}).get("messages", [])
-            conversation_context = self._build_conversation_context(messages)
-
-            # Otimizar tamanho do prompt
-            optimized_context = self._optimize_prompt_size(conversation_context)
+    def _validate_request(self, request: LLMRequest) -> LLMResponse | None:
+        """Retorna resposta imediata se a requisição não deve chegar ao Gemini"""
+        # Validar entrada
+        if not request.message or not request.message.strip():
+            return LLMResponse(
+                message="Por favor, digite uma mensagem para que eu possa te ajudar.",
+                session_id=request.session_id,
+                confidence=0.0,
+                metadata={"error": "empty_message"},
+            )
 
-            # Adicionar mensagem atual do usuário
-            optimized_context.append({"role": "user", "content": request.message})
+        return None
 
-            # Verificar cache
-            cache_key = self.cache._generate_key(
-                optimized_context[:-1], request.message
+    def _get_window(self, session_id: str) -> ConversationWindow:
+        """Recupera (ou cria) a janela de contexto da sessão"""
+        window = self.windows.get(session_id)
+        if window is None:
+            window = ConversationWindow(
+                self.context_token_budget, self.summary_max_chars
             )
-            cached_response = self.cache.get(cache_key)
+            if len(self.windows) >= self.max_windows:
+                self.windows.popitem(last=False)
+            self.windows[session_id] = window
+        else:
+            self.windows.move_to_end(session_id)
+        return window
+
+    def release_session(self, session_id: str):
+        """Descarta a janela de contexto de uma sessão encerrada"""
+        self.windows.pop(session_id, None)
+
+    def _prepare_context(self, request: LLMRequest) -> tuple[list[dict[str, str]], str]:
+        """Monta o histórico dentro do orçamento de tokens e a chave de cache"""
+        messages = (request.context or {}).get("messages", []) or []
+        # A mensagem atual já foi registrada na sessão: fica fora da janela
+        # (truncada, deixaria de ser reconhecida e seria enviada duas vezes)
+        if messages and _is_user_message(messages[-1], request.message):
+            messages = messages[:-1]
+        window = self._get_window(request.session_id)
+        window.sync(messages)
+        history = window.history()
+
+        cache_key = self.cache._generate_key(history, request.message)
+        return history, cache_key
+
+    def _count_prior_user_messages(self, request: LLMRequest) -> int:
+        """Conta mensagens do usuário no contexto, excluindo a mensagem atual"""
+        messages = (request.context or {}).get("messages", []) or []
+        roles = [
+            getattr(m, "role", None) or (m.get("role") if isinstance(m, dict) else None)
+            for m in messages
+        ]
+        count = sum(1 for role in roles if role in (MessageRole.USER, "user"))
+        if count and _is_user_message(messages[-1], request.message):
+            count -= 1
+        return count
+
+    def _semantic_cache_key(self, request: LLMRequest) -> str | None:
+        """Chave do cache normalizado; apenas para a 1ª mensagem do usuário"""
+        if self._count_prior_user_messages(request) > 0:
+            return None
+        ctx = request.context or {}
+        return self.semantic_cache._generate_semantic_key(
+            request.message,
+            self._get_phase_from_context(ctx),
+            bool(ctx.get("user_profile")),
+        )
 
-            if cached_response:
-                cached_response.session_id = request.session_id
-                cached_response.metadata = {
-                    **cached_response.metadata,
-                    "cached": True,
-                    "cache_hit": True,
-                }
-                return cached_response
+    async def _get_cached_response(
+        self, request: LLMRequest, cache_key: str
+    ) -> LLMResponse | None:
+        """Recupera resposta do cache ajustada para a sessão atual"""
+        cache_tier = "exact"
+        cached_response = await self.cache.aget(cache_key)
+        if not cached_response:
+            semantic_key = self._semantic_cache_key(request)
+            if semantic_key:
+                cached_response = await self.semantic_cache.aget(semantic_key)
+                cache_tier = "semantic"
+        if not cached_response:
+            return None
 
-            # Detectar intenção
-            detected_intent = self._detect_intent(request.message)
+        cached_response.session_id = request.session_id
+        cached_response.metadata = {
+            **cached_response.metadata,
+            "cached": True,
+            "cache_hit": True,
+            "cache_tier": cache_tier,
+        }
+        if cache_tier == "semantic":
+            # Intenção recalculada a partir do texto original desta sessão
+            cached_response.intent_detected = self._request_intent(request)
+        return cached_response
+
+    def _start_chat(
+        self,
+        request: LLMRequest,
+        history: list[dict[str, str]],
+        detected_intent: str | None,
+    ) -> Any:
+        """Cria o chat do Gemini com system instruction contextual e histórico"""
+        # Injetar política determinística de captura/agendamento
+        policy_instructions = self._compose_policy_instructions(
+            request.context, request.message
+        )
 
+        def build_instruction() -> str:
             # Gerar prompt contextual
             contextual_prompt = self._get_contextual_prompt(
                 request.message, detected_intent
             )
-
-            # Injetar política determinística de captura/agendamento
-            policy_instructions = self._compose_policy_instructions(
-                request.context, request.message
-            )
             if policy_instructions:
                 contextual_prompt = f"{contextual_prompt}\n\nPOLÍTICA ATUAL (OBRIGATÓRIA): {policy_instructions}"
+            return contextual_prompt
 
-            # Criar modelo com system instruction contextual
-            model = genai.GenerativeModel(
-                self.model_name,
-                system_instruction=contextual_prompt
-            )
+        # Reutilizar modelo com system instruction contextual
+        model = self.model_registry.get(
+            self._get_prompt_variant(detected_intent),
+            policy_instructions,
+            build_instruction,
+        )
 
-            # Converter histórico para formato Gemini
-            history_parts = []
-            for msg in optimized_context[1:]:  # Pular system prompt (já está no model)
-                role = "user" if msg["role"] == "user" else "model"
-                history_parts.append({
-                    "role": role,
-                    "parts": [msg["content"]]
-                })
-
-            # Criar chat com histórico
-            chat = model.start_chat(history=history_parts)
-
-            # Enviar mensagem atual
-            gemini_response = chat.send_message(
-                request.message,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                )
-            )
+        # Converter histórico para formato Gemini
+        history_parts = []
+        for msg in history:
+            role = "user" if msg["role"] == "user" else "model"
+            history_parts.append({
+                "role": role,
+                "parts": [msg["content"]]
+            })
 
-            # Extrair resposta
-            response_content = gemini_response.text
+        # Criar chat com histórico
+        return model.start_chat(history=history_parts)
 
-            # Extrair informações do usuário
-            user_profile = self._extract_user_profile(request.message)
+    async def _build_response(
+        self,
+        request: LLMRequest,
+        cache_key: str,
+        response_content: str,
+        detected_intent: str | None,
+        usage_metadata: Any = None,
+    ) -> LLMResponse:
+        """Monta a resposta final e armazena no cache"""
+        # Extrair informações do usuário
+        user_profile = self._extract_user_profile(request.message)
+
+        # Calcular confiança baseada na resposta
+        confidence = 0.8  # Base inicial, pode ser melhorada
+
+        # Extrair tokens usados
+        tokens_used = tokens_in = tokens_out = None
+        if usage_metadata is not None:
+            tokens_used = usage_metadata.total_token_count
+            tokens_in = usage_metadata.prompt_token_count
+            tokens_out = usage_metadata.candidates_token_count
+            self.token_stats["requests"] += 1
+            self.token_stats["tokens_in"] += tokens_in or 0
+            self.token_stats["tokens_out"] += tokens_out or 0
+
+        response = LLMResponse(
+            message=response_content,
+            session_id=request.session_id,
+            user_profile_extracted=user_profile,
+            intent_detected=detected_intent,
+            confidence=confidence,
+            metadata={
+                "model": self.model_name,
+                "tokens_used": tokens_used,
+                "tokens_in": tokens_in,
+                "tokens_out": tokens_out,
+                "timestamp": datetime.now().isoformat(),
+                "cached": False,
+                "cache_hit": False,
+            },
+        )
 
-            # Usar a intenção já detectada
-            intent = detected_intent
+        # Armazenar no cache
+        await self.cache.aset(cache_key, response)
 
-            # Calcular confiança baseada na resposta
-            confidence = 0.8  # Base inicial, pode ser melhorada
+        # Cache normalizado apenas para respostas sem dados pessoais
+        if not user_profile:
+            semantic_key = self._semantic_cache_key(request)
+            if semantic_key:
+                await self.semantic_cache.aset(semantic_key, response)
 
-            # Extrair tokens usados
-            tokens_used = None
-            if hasattr(gemini_response, 'usage_metadata'):
-                tokens_used = gemini_response.usage_metadata.total_token_count
+        return response
 
-            response = LLMResponse(
-                message=response_content,
-                session_id=request.session_id,
-                user_profile_extracted=user_profile,
-                intent_detected=intent,
-                confidence=confidence,
-                metadata={
-                    "model": self.model_name,
-                    "tokens_used": tokens_used,
-                    "timestamp": datetime.now().isoformat(),
-                    "cached": False,
-                    "cache_hit": False,
-                },
+    def _timeout_response(self, request: LLMRequest) -> LLMResponse:
+        """Resposta de fallback quando o Gemini excede o timeout"""
+        logger.warning(
+            f"Timeout de {self.request_timeout}s no Gemini (sessão {request.session_id})"
+        )
+        return LLMResponse(
+            message="Desculpe, a resposta está demorando mais que o esperado. Pode tentar novamente em alguns instantes?",
+            session_id=request.session_id,
+            confidence=0.0,
+            metadata={"error": "timeout", "fallback": True},
+        )
+
+    def _circuit_open_response(
+        self, request: LLMRequest, error: CircuitOpenError
+    ) -> LLMResponse:
+        """Resposta imediata enquanto o circuito do Gemini está aberto"""
+        return LLMResponse(
+            message="Desculpe, estou com dificuldades técnicas no momento. Pode tentar novamente em alguns instantes?",
+            session_id=request.session_id,
+            confidence=0.0,
+            metadata={
+                "error": "circuit_open",
+                "fallback": True,
+                "retry_after": round(error.retry_after, 2),
+            },
+        )
+
+    def _error_response(self, request: LLMRequest, error: Exception) -> LLMResponse:
+        """Resposta de fallback em caso de erro"""
+        fallback_response = "Desculpe, estou com dificuldades técnicas no momento. Pode tentar novamente em alguns instantes?"
+
+        return LLMResponse(
+            message=fallback_response,
+            session_id=request.session_id,
+            confidence=0.0,
+            metadata={"error": str(error), "fallback": True},
+        )
+
+    async def _generate_uncached(
+        self,
+        request: LLMRequest,
+        history: list[dict[str, str]],
+        cache_key: str,
+    ) -> LLMResponse:
+        """Chama o Gemini e monta a resposta (inclui fallbacks de erro/timeout)"""
+        try:
+            self.circuit_breaker.before_call()
+        except CircuitOpenError as e:
+            return self._circuit_open_response(request, e)
+
+        try:
+            # Detectar intenção
+            detected_intent = self._request_intent(request)
+
+            # Cada tentativa (original ou hedge) usa um chat próprio
+            def send() -> Awaitable[Any]:
+                chat = self._start_chat(request, history, detected_intent)
+                return self._send_message(chat, request.message)
+
+            # Enviar mensagem atual sem bloquear o event loop (timeout cancela a chamada)
+            gemini_response = await asyncio.wait_for(
+                self.hedger.call(send),
+                timeout=self.request_timeout,
             )
+            response_text = gemini_response.text
+
+        except TimeoutError:
+            self.circuit_breaker.record_failure()
+            return self._timeout_response(request)
 
-            # Armazenar no cache
-            self.cache.set(cache_key, response)
+        except asyncio.CancelledError:
+            self.circuit_breaker.record_cancelled()
+            raise
+
+        except Exception as e:
+            self.circuit_breaker.record_failure()
+            return self._error_response(request, e)
 
+        self.circuit_breaker.record_success()
+        try:
+            return await self._build_response(
+                request,
+                cache_key,
+                response_text,
+                detected_intent,
+                getattr(gemini_response, "usage_metadata", None),
+            )
+        except Exception as e:
+            return self._error_response(request, e)
+
+    async def generate_response(self, request: LLMRequest) -> LLMResponse:
+        """Gera resposta usando Groq LLM com cache e otimizações"""
+        try:
+            early_response = self._validate_request(request)
+            if early_response:
+                return early_response
+
+            history, cache_key = self._prepare_context(request)
+
+            # Verificar cache
+            cached_response = await self._get_cached_response(request, cache_key)
+            if cached_response:
+                return cached_response
+
+            # Requisições idênticas simultâneas aguardam uma única chamada ao Gemini
+            response, shared = await self.single_flight.do(
+                cache_key,
+                lambda: self._generate_uncached(request, history, cache_key),
+            )
+            if shared:
+                response = response.model_copy(
+                    deep=True, update={"session_id": request.session_id}
+                )
+                response.metadata = {**(response.metadata or {}), "coalesced": True}
             return response
 
         except Exception as e:
-            # Fallback em caso de erro
-            fallback_response = "Desculpe, estou com dificuldades técnicas no momento. Pode tentar novamente em alguns instantes?"
+            return self._error_response(request, e)
+
+    async def stream_response(
+        self, request: LLMRequest
+    ) -> AsyncIterator[dict[str, Any]]:
+        """
+        Gera resposta em streaming a partir do Gemini
+
+        Emite eventos {"type": "token", "text": ...} conforme o Gemini produz o
+        texto e, ao final, um único {"type": "done", "response": LLMResponse}
+        com a mesma resposta que generate_response retornaria.
+        """
+        try:
+            early_response = self._validate_request(request)
+            if early_response:
+                yield {"type": "done", "response": early_response}
+                return
 
-            return LLMResponse(
-                message=fallback_response,
-                session_id=request.session_id,
-                confidence=0.0,
-                metadata={"error": str(e), "fallback": True},
+            history, cache_key = self._prepare_context(request)
+
+            # Cache hit: entregar resposta completa de uma vez
+            cached_response = await self._get_cached_response(request, cache_key)
+            if cached_response:
+                yield {"type": "token", "text": cached_response.message}
+                yield {"type": "done", "response": cached_response}
+                return
+
+            detected_intent = self._request_intent(request)
+            chat = self._start_chat(request, history, detected_intent)
+
+            try:
+                self.circuit_breaker.before_call()
+            except CircuitOpenError as e:
+                yield {
+                    "type": "done",
+                    "response": self._circuit_open_response(request, e),
+                }
+                return
+
+            # Produtor: lê o Gemini e enfileira os trechos. O slot do semáforo
+            # é liberado quando a geração termina, não quando o cliente lê:
+            # um leitor lento de SSE não prende vagas do Gemini.
+            tokens: asyncio.Queue[str | None] = asyncio.Queue()
+            producer = asyncio.create_task(
+                self._produce_stream(chat, request.message, tokens)
             )
+            parts: list[str] = []
+            try:
+                while (text := await tokens.get()) is not None:
+                    parts.append(text)
+                    yield {"type": "token", "text": text}
+                usage_metadata = await producer
+            finally:
+                if not producer.done():
+                    # Cliente desconectou: interromper a geração
+                    producer.cancel()
+                elif not producer.cancelled():
+                    producer.exception()  # Erro já tratado (ou cliente saiu)
+
+            yield {
+                "type": "done",
+                "response": await self._build_response(
+                    request, cache_key, "".join(parts), detected_intent, usage_metadata
+                ),
+            }
+
+        except TimeoutError:
+            yield {"type": "done", "response": self._timeout_response(request)}
+
+        except Exception as e:
+            yield {"type": "done", "response": self._error_response(request, e)}
+
+    async def _produce_stream(
+        self, chat: Any, message: str, tokens: asyncio.Queue
+    ) -> Any:
+        """
+        Consome o stream do Gemini dentro do semáforo, enfileirando os trechos
+
+        None na fila marca o fim (também em erro/cancelamento). Retorna o
+        usage_metadata; timeout aplicado ao início e a cada chunk.
+        """
+        try:
+            async with self._gemini_semaphore:
+                self.inflight_requests += 1
+                try:
+                    gemini_stream = await asyncio.wait_for(
+                        chat.send_message_async(
+                            message,
+                            stream=True,
+                            generation_config=genai.types.GenerationConfig(
+                                max_output_tokens=self.max_tokens,
+                                temperature=self.temperature,
+                            ),
+                        ),
+                        timeout=self.request_timeout,
+                    )
+                    chunks = gemini_stream.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(
+                                anext(chunks), timeout=self.request_timeout
+                            )
+                        except StopAsyncIteration:
+                            break
+                        if chunk.text:
+                            tokens.put_nowait(chunk.text)
+                except asyncio.CancelledError:
+                    # Cliente desconectou: não é falha do Gemini
+                    self.circuit_breaker.record_cancelled()
+                    raise
+                except Exception:
+                    self.circuit_breaker.record_failure()
+                    raise
+                else:
+                    self.circuit_breaker.record_success()
+                finally:
+                    self.inflight_requests -= 1
+            return getattr(gemini_stream, "usage_metadata", None)
+        finally:
+            tokens.put_nowait(None)
 
     def create_welcome_message(self) -> str:
         """Cria mensagem de boas-vindas personalizada"""
@@ -655,28 +1825,39 @@ Responda de forma natural e estruturada, com 2-3 frases. Sempre aplique quebras
             "max_tokens": self.max_tokens,
             "temperature": self.temperature,
             "cache_stats": self.cache.get_stats(),
-            "request_count": self.request_count,
-            "max_requests_per_minute": self.max_requests_per_minute,
+            "semantic_cache_stats": self.semantic_cache.get_stats(),
+            "model_registry": self.model_registry.get_stats(),
+            "single_flight": self.single_flight.get_stats(),
+            "context_windows": {
+                "active": len(self.windows),
+                "token_budget": self.context_token_budget,
+            },
+            "tokens": self.token_stats,
+            "rate_limit": self.rate_limiter.get_stats(),
+            "circuit_breaker": self.circuit_breaker.get_stats(),
+            "hedging": self.hedger.get_stats(),
+            "inflight_requests": self.inflight_requests,
+            "max_concurrent_requests": self.max_concurrent_requests,
+            "request_timeout": self.request_timeout,
         }
 
     def clear_cache(self):
         """Limpa o cache"""
         self.cache.clear()
+        self.semantic_cache.clear()
 
     def cleanup_cache(self):
         """Remove itens expirados do cache"""
         self.cache.clear_expired()
+        self.semantic_cache.clear_expired()
 
     def auto_cleanup_cache(self):
         """Limpeza automática do cache - chamar periodicamente"""
-        if len(self.cache.cache) > self.cache.max_size * 0.8:  # Se 80% cheio
+        if len(self.cache) > self.cache.max_size * 0.8:  # Se 80% cheio
             self.cache.clear_expired()
             # Se ainda estiver cheio, remover 20% dos itens mais antigos
-            if len(self.cache.cache) > self.cache.max_size * 0.8:
-                items_to_remove = int(len(self.cache.cache) * 0.2)
-                for _ in range(items_to_remove):
-                    if self.cache.cache:
-                        self.cache.cache.popitem(last=False)
+            if len(self.cache) > self.cache.max_size * 0.8:
+                self.cache.evict_oldest(int(len(self.cache) * 0.2))
 
 
 # Instância global do serviço
@@ -6,26 +6,38 @@ Tecnologias: FastAPI + Python + Pydantic + Google Gemini LLM
 Arquitetura: API-First, Desacoplada do Frontend
 """
 
+import json
+import math
 import os
 from datetime import datetime
+from typing import Any
 
 import google.generativeai as genai
 import uvicorn
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic_core import to_json
 
 from chat_manager import chat_manager
 from database import db_manager
-from llm_service import llm_service
+from llm_service import RateLimitExceededError, llm_service
 from notification_service import notification_service
-from playground_service import playground_service
+from playground_service import (
+    SEGMENTS_MISMATCH_ERROR,
+    TranscriptFetchCancelledError,
+    playground_service,
+    segments_match_transcript,
+)
 from schemas import (
     BaseModel,
+    BatchSummarizeRequest,
     ChatEndRequest,
     ChatEndResponse,
     ChatStartRequest,
     ChatStartResponse,
+    ColumnarTranscribeResponse,
     EmailStr,
     LLMRequest,
     LLMResponse,
@@ -34,6 +46,8 @@ from schemas import (
     SummarizeResponse,
     TranscribeRequest,
     TranscribeResponse,
+    TranscriptFormat,
+    TranscriptSegment,
     UserProfile,
 )
 
@@ -65,6 +79,13 @@ FRONTEND_URL = os.getenv("FRONTEND_URL")
 if FRONTEND_URL and FRONTEND_URL not in ALLOWED_ORIGINS:
     ALLOWED_ORIGINS.append(FRONTEND_URL)
 
+# Proxies reversos confiáveis (IPs separados por vírgula; "*" quando todo o
+# tráfego passa pelo proxy da plataforma, como no Railway). Vazio: o
+# X-Forwarded-For é ignorado e o IP da conexão identifica o cliente.
+TRUSTED_PROXY_IPS = {
+    ip.strip() for ip in os.getenv("TRUSTED_PROXY_IPS", "").split(",") if ip.strip()
+}
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
@@ -73,6 +94,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse serializada pelo pydantic-core em uma única passada
+
+    Retornar uma instância desta classe no endpoint dispensa o caminho padrão
+    do FastAPI (model_dump -> revalidação pelo response_model ->
+    jsonable_encoder -> json.dumps). Aceita dicts/listas simples e modelos
+    Pydantic já validados, inclusive aninhados.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return to_json(content, inf_nan_mode="null", fallback=str)
+
+
 # === SCHEMAS LEGACY (Mantidos para compatibilidade) ===
 
 
@@ -323,48 +359,113 @@ async def start_chat(request: ChatStartRequest):
         ) from e
 
 
+def _client_ip(http_request: Request) -> str | None:
+    """
+    IP do cliente para o rate limit
+
+    O X-Forwarded-For só é considerado quando a conexão vem de um proxy
+    confiável (TRUSTED_PROXY_IPS); nesse caso vale a última entrada, a que o
+    próprio proxy acrescentou. Sem isso, qualquer cliente poderia trocar de
+    IP a cada requisição apenas mudando o cabeçalho.
+    """
+    peer = http_request.client.host if http_request.client else None
+    forwarded_for = http_request.headers.get("x-forwarded-for")
+    if forwarded_for and ("*" in TRUSTED_PROXY_IPS or peer in TRUSTED_PROXY_IPS):
+        return forwarded_for.split(",")[-1].strip()
+    return peer
+
+
+def _build_llm_request(request: LLMRequest, http_request: Request) -> LLMRequest:
+    """
+    Valida a sessão e o rate limit, registra a mensagem do usuário e monta a
+    requisição ao LLM
+    """
+    # Verificar se sessão existe
+    session = chat_manager.get_session(request.session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada ou expirada")
+
+    # Verificar rate limit antes de registrar a mensagem
+    try:
+        llm_service.check_rate_limit(request.session_id, _client_ip(http_request))
+    except RateLimitExceededError as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Muitas solicitações no momento. Tente novamente em alguns instantes.",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        ) from e
+
+    # Adicionar mensagem do usuário
+    chat_manager.add_message(request.session_id, MessageRole.USER, request.message)
+
+    # Gerar resposta do LLM com contexto completo
+    return LLMRequest(
+        session_id=request.session_id,
+        message=request.message,
+        context={
+            "messages": session.messages,
+            "phase": session.phase if hasattr(session, "phase") else None,
+            "user_profile": session.user_profile or {},
+        },
+    )
+
+
+def _record_assistant_response(session_id: str, response: LLMResponse) -> None:
+    """Registra a resposta do assistente e o perfil extraído na sessão"""
+    # Adicionar resposta do assistente
+    chat_manager.add_message(session_id, MessageRole.ASSISTANT, response.message)
+
+    # Atualizar perfil do usuário se extraído
+    if response.user_profile_extracted:
+        chat_manager.update_user_profile(session_id, response.user_profile_extracted)
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Formata um evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _ndjson_line(data: dict) -> bytes:
+    """Formata uma linha NDJSON (aceita modelos Pydantic aninhados)"""
+    return to_json(data, inf_nan_mode="null", fallback=str) + b"\n"
+
+
 @app.post("/chat/message", response_model=LLMResponse)
-async def send_message(request: LLMRequest):
+async def send_message(request: LLMRequest, http_request: Request):
     """
     Envia mensagem para o LLM e retorna resposta
     """
     try:
-        # Verificar se sessão existe
-        session = chat_manager.get_session(request.session_id)
-        if not session:
-            raise HTTPException(
-                status_code=404, detail="Sessão não encontrada ou expirada"
-            )
+        llm_request = _build_llm_request(request, http_request)
 
-        # Adicionar mensagem do usuário
-        chat_manager.add_message(request.session_id, MessageRole.USER, request.message)
+        response = await llm_service.generate_response(llm_request)
 
-        # Gerar resposta do LLM com contexto completo
-        llm_request = LLMRequest(
-            session_id=request.session_id,
-            message=request.message,
-            context={
-                "messages": session.messages,
-                "phase": session.phase if hasattr(session, "phase") else None,
-                "user_profile": session.user_profile or {},
-            },
-        )
+        _record_assistant_response(request.session_id, response)
 
-        response = await llm_service.generate_response(llm_request)
+        return response
 
-        # Adicionar resposta do assistente
-        chat_manager.add_message(
-            request.session_id, MessageRole.ASSISTANT, response.message
-        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Erro ao processar mensagem: {e!s}"
+        ) from e
 
-        # Atualizar perfil do usuário se extraído
-        if response.user_profile_extracted:
-            chat_manager.update_user_profile(
-                request.session_id, response.user_profile_extracted
-            )
 
-        return response
+@app.post("/chat/message/stream")
+async def send_message_stream(request: LLMRequest, http_request: Request):
+    """
+    Envia mensagem para o LLM e retorna a resposta em streaming (SSE)
 
+    Eventos:
+        token: {"text": "..."} - trecho gerado pelo Gemini
+        done: LLMResponse completo, emitido após registrar a resposta na sessão
+
+    Se o cliente desconectar antes do "done", a geração é cancelada e o trecho
+    já enviado é registrado na sessão, marcado como interrompido.
+    """
+    try:
+        llm_request = _build_llm_request(request, http_request)
     except HTTPException:
         raise
     except Exception as e:
@@ -372,6 +473,40 @@ async def send_message(request: LLMRequest):
             status_code=500, detail=f"Erro ao processar mensagem: {e!s}"
         ) from e
 
+    async def event_stream():
+        sent: list[str] = []
+        recorded = False
+        try:
+            async for event in llm_service.stream_response(llm_request):
+                if event["type"] == "token":
+                    sent.append(event["text"])
+                    yield _sse_event("token", {"text": event["text"]})
+                    continue
+
+                response = event["response"]
+                _record_assistant_response(request.session_id, response)
+                recorded = True
+                yield _sse_event("done", response.model_dump(mode="json"))
+        finally:
+            if not recorded:
+                # Cliente desconectou antes do fim (geração cancelada): registrar
+                # o trecho já enviado para a mensagem do usuário não ficar sem
+                # resposta no histórico
+                partial = "".join(sent).strip()
+                chat_manager.add_message(
+                    request.session_id,
+                    MessageRole.ASSISTANT,
+                    f"{partial} [resposta interrompida]"
+                    if partial
+                    else "[Resposta interrompida: o cliente desconectou]",
+                )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @app.get("/chat/inactivity-check/{session_id}")
 async def check_inactivity(session_id: str):
@@ -474,11 +609,8 @@ async def get_llm_stats():
     """
     return {
         "cache_stats": llm_service.get_cache_stats(),
-        "rate_limit": {
-            "current_requests": llm_service.request_count,
-            "max_requests_per_minute": llm_service.max_requests_per_minute,
-            "reset_time": llm_service.last_reset.isoformat(),
-        },
+        "semantic_cache_stats": llm_service.semantic_cache.get_stats(),
+        "rate_limit": llm_service.rate_limiter.get_stats(),
     }
 
 
@@ -520,6 +652,9 @@ async def detailed_health_check():
 
         # Estatísticas do LLM
         llm_stats = llm_service.get_cache_stats()
+        circuit_stats = llm_service.circuit_breaker.get_stats()
+        if circuit_stats["state"] != "closed":
+            gemini_status = f"degraded: circuit {circuit_stats['state']}"
 
         return {
             "status": "healthy",
@@ -531,7 +666,15 @@ async def detailed_health_check():
                 "chat_manager": "healthy",
                 "llm_service": "healthy",
             },
-            "statistics": {"chat": chat_stats, "llm": llm_stats},
+            "statistics": {
+                "chat": chat_stats,
+                "llm": llm_stats,
+                "circuit_breaker": circuit_stats,
+                "hedging": llm_service.hedger.get_stats(),
+                "playground_cache": playground_service.get_cache_stats(),
+                "transcript_store": playground_service.get_transcript_store_stats(),
+                "transcript_paths": playground_service.get_transcript_path_stats(),
+            },
         }
 
     except Exception as e:
@@ -545,7 +688,7 @@ async def detailed_health_check():
 # === ENDPOINTS DE DASHBOARD E GERENCIAMENTO ===
 
 
-@app.get("/dashboard/leads")
+@app.get("/dashboard/leads", response_class=FastJSONResponse)
 async def get_leads_dashboard(status: str | None = None, limit: int = 50):
     """
     Endpoint para dashboard de leads
@@ -554,7 +697,9 @@ async def get_leads_dashboard(status: str | None = None, limit: int = 50):
         leads = db_manager.get_all_leads(status=status, limit=limit)
         stats = db_manager.get_stats()
 
-        return {"leads": leads, "stats": stats, "total_leads": len(leads)}
+        return FastJSONResponse(
+            {"leads": leads, "stats": stats, "total_leads": len(leads)}
+        )
 
     except Exception as e:
         raise HTTPException(
@@ -562,7 +707,7 @@ async def get_leads_dashboard(status: str | None = None, limit: int = 50):
         ) from e
 
 
-@app.get("/dashboard/leads/{session_id}")
+@app.get("/dashboard/leads/{session_id}", response_class=FastJSONResponse)
 async def get_lead_details(session_id: str):
     """
     Endpoint para detalhes de um lead específico
@@ -572,7 +717,7 @@ async def get_lead_details(session_id: str):
         if not lead:
             raise HTTPException(status_code=404, detail="Lead não encontrado")
 
-        return lead
+        return FastJSONResponse(lead)
 
     except Exception as e:
         raise HTTPException(
@@ -614,7 +759,7 @@ async def update_lead_status(session_id: str, status: str, notes: str | None = N
         ) from e
 
 
-@app.get("/dashboard/notifications")
+@app.get("/dashboard/notifications", response_class=FastJSONResponse)
 async def get_notifications(unread_only: bool = True):
     """
     Endpoint para recuperar notificações
@@ -622,7 +767,9 @@ async def get_notifications(unread_only: bool = True):
     try:
         notifications = db_manager.get_notifications(unread_only=unread_only)
 
-        return {"notifications": notifications, "total": len(notifications)}
+        return FastJSONResponse(
+            {"notifications": notifications, "total": len(notifications)}
+        )
 
     except Exception as e:
         raise HTTPException(
@@ -650,7 +797,7 @@ async def mark_notification_read(notification_id: int):
         ) from e
 
 
-@app.get("/dashboard/stats")
+@app.get("/dashboard/stats", response_class=FastJSONResponse)
 async def get_dashboard_stats():
     """
     Endpoint para estatísticas do dashboard
@@ -660,12 +807,14 @@ async def get_dashboard_stats():
         chat_stats = chat_manager.get_session_stats()
         llm_stats = llm_service.get_stats()
 
-        return {
-            "database": db_stats,
-            "chat": chat_stats,
-            "llm": llm_stats,
-            "timestamp": datetime.now().isoformat(),
-        }
+        return FastJSONResponse(
+            {
+                "database": db_stats,
+                "chat": chat_stats,
+                "llm": llm_stats,
+                "timestamp": datetime.now().isoformat(),
+            }
+        )
 
     except Exception as e:
         raise HTTPException(
@@ -673,7 +822,7 @@ async def get_dashboard_stats():
         ) from e
 
 
-@app.get("/dashboard/conversation-summaries")
+@app.get("/dashboard/conversation-summaries", response_class=FastJSONResponse)
 async def get_conversation_summaries(limit: int = 50, offset: int = 0):
     """
     Endpoint para recuperar resumos de conversa
@@ -683,7 +832,7 @@ async def get_conversation_summaries(limit: int = 50, offset: int = 0):
             limit=limit, offset=offset
         )
 
-        return {"summaries": summaries, "total": len(summaries)}
+        return FastJSONResponse({"summaries": summaries, "total": len(summaries)})
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Erro ao recuperar resumos: {e!s}"
@@ -702,7 +851,9 @@ async def delete_conversation(session_id: str):
         ) from e
 
 
-@app.get("/dashboard/conversation-summaries/{session_id}")
+@app.get(
+    "/dashboard/conversation-summaries/{session_id}", response_class=FastJSONResponse
+)
 async def get_conversation_summary_details(session_id: str):
     """
     Endpoint para detalhes de um resumo de conversa específico
@@ -714,7 +865,7 @@ async def get_conversation_summary_details(session_id: str):
                 status_code=404, detail="Resumo de conversa não encontrado"
             )
 
-        return summary
+        return FastJSONResponse(summary)
 
     except Exception as e:
         raise HTTPException(
@@ -954,32 +1105,84 @@ async def test_database():
 # === ENDPOINTS DE PLAYGROUND ===
 
 
-@app.post("/playground/transcribe", response_model=TranscribeResponse)
-async def transcribe_youtube_video(request: TranscribeRequest):
+@app.post(
+    "/playground/transcribe",
+    response_model=TranscribeResponse | ColumnarTranscribeResponse,
+    response_class=FastJSONResponse,
+)
+async def transcribe_youtube_video(request: TranscribeRequest, http_request: Request):
     """
     Endpoint para obter transcrição de vídeo do YouTube
 
     Args:
-        request: TranscribeRequest com video_url
+        request: TranscribeRequest com video_url e format
 
     Returns:
-        TranscribeResponse com transcrição e metadados
+        TranscribeResponse com transcrição e metadados, ou
+        ColumnarTranscribeResponse com format="columnar"
     """
     try:
-        # Obter transcrição
-        result = playground_service.get_transcript(request.video_url)
+        # Obter transcrição fora do event loop (cancelada se o cliente sair)
+        result = await playground_service.get_transcript_async(
+            request.video_url, is_disconnected=http_request.is_disconnected
+        )
+        compact = result.pop("compact")
+
+        # Dados montados pelo próprio serviço (tipos garantidos): serializa
+        # direto, sem instanciar um TranscriptSegment por legenda
+        if request.format == TranscriptFormat.COLUMNAR:
+            columns = compact.to_columnar()
+            return FastJSONResponse(
+                {
+                    **result,
+                    "format": TranscriptFormat.COLUMNAR,
+                    "segment_offsets": columns["offsets"],
+                    "segment_starts": columns["starts"],
+                    "segment_durations": columns["durations"],
+                }
+            )
 
-        return TranscribeResponse(**result)
+        return FastJSONResponse({**result, "segments": compact.segments()})
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
+    except TimeoutError as e:
+        raise HTTPException(
+            status_code=504,
+            detail="A busca da transcrição demorou demais. Tente novamente em instantes.",
+        ) from e
+    except TranscriptFetchCancelledError as e:
+        # Cliente desconectou: a resposta não será entregue
+        raise HTTPException(status_code=499, detail="Requisição cancelada") from e
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Erro ao processar transcrição: {e!s}"
         ) from e
 
 
-@app.post("/playground/summarize", response_model=SummarizeResponse)
+def _transcript_error(
+    transcript: str, segments: list[dict] | None = None
+) -> str | None:
+    """
+    Valida o tamanho da transcrição e, se enviados, os segmentos
+
+    Os segmentos definem os chunks: precisam formar exatamente a transcrição
+    validada. Retorna a mensagem de erro se inválido.
+    """
+    if len(transcript) < 50:
+        return "Transcrição muito curta. Mínimo de 50 caracteres."
+    if len(transcript) > 100000:
+        return "Transcrição muito longa. Máximo de 100.000 caracteres."
+    if segments and not segments_match_transcript(segments, transcript):
+        return SEGMENTS_MISMATCH_ERROR
+    return None
+
+
+@app.post(
+    "/playground/summarize",
+    response_model=SummarizeResponse,
+    response_class=FastJSONResponse,
+)
 async def summarize_transcript(request: SummarizeRequest):
     """
     Endpoint para sumarizar transcrição usando IA
@@ -991,27 +1194,28 @@ async def summarize_transcript(request: SummarizeRequest):
         SummarizeResponse com resumo e análise
     """
     try:
-        # Validar tamanho da transcrição
-        if len(request.transcript) < 50:
-            raise HTTPException(
-                status_code=400,
-                detail="Transcrição muito curta. Mínimo de 50 caracteres.",
-            )
+        segments = (
+            [segment.model_dump() for segment in request.segments]
+            if request.segments
+            else None
+        )
 
-        if len(request.transcript) > 100000:
-            raise HTTPException(
-                status_code=400,
-                detail="Transcrição muito longa. Máximo de 100.000 caracteres.",
-            )
+        # Validar tamanho da transcrição e segmentos
+        transcript_error = _transcript_error(request.transcript, segments)
+        if transcript_error:
+            raise HTTPException(status_code=400, detail=transcript_error)
 
         # Gerar sumarização
-        result = playground_service.summarize_transcript(
+        result = await playground_service.summarize_transcript_async(
             transcript=request.transcript,
             context=request.context,
             keywords=request.keywords,
+            mode=request.mode.value,
+            segments=segments,
         )
 
-        return SummarizeResponse(**result)
+        # Validado uma única vez (a saída do LLM é externa); sem revalidação na saída
+        return FastJSONResponse(SummarizeResponse(**result))
 
     except HTTPException:
         raise
@@ -1023,7 +1227,62 @@ async def summarize_transcript(request: SummarizeRequest):
         ) from e
 
 
-@app.post("/playground/analyze-keywords")
+@app.post("/playground/summarize/batch")
+async def summarize_transcripts_batch(request: BatchSummarizeRequest):
+    """
+    Sumariza várias transcrições em paralelo (concorrência limitada)
+
+    Responde em NDJSON: uma linha por item assim que ele fica pronto
+    ({"type": "item", "index", "status", ...}) e uma linha final
+    {"type": "done", ...} com os totais.
+    """
+    if not playground_service.model:
+        raise HTTPException(
+            status_code=400,
+            detail="Serviço de sumarização não disponível. Verifique a configuração da API Gemini.",
+        )
+
+    invalid: dict[int, str] = {}
+    valid_items: list[dict] = []
+    valid_indexes: list[int] = []
+    for index, item in enumerate(request.items):
+        item_data = item.model_dump(mode="json")
+        transcript_error = _transcript_error(item.transcript, item_data.get("segments"))
+        if transcript_error:
+            invalid[index] = transcript_error
+        else:
+            valid_indexes.append(index)
+            valid_items.append(item_data)
+
+    async def event_stream():
+        start = datetime.now()
+        succeeded = 0
+        for index, error in invalid.items():
+            yield _ndjson_line(
+                {"type": "item", "index": index, "status": "error", "error": error}
+            )
+        async for outcome in playground_service.summarize_batch(
+            valid_items, request.max_concurrency
+        ):
+            outcome["index"] = valid_indexes[outcome["index"]]
+            if outcome["status"] == "ok":
+                outcome["result"] = SummarizeResponse(**outcome["result"])
+                succeeded += 1
+            yield _ndjson_line({"type": "item", **outcome})
+        yield _ndjson_line(
+            {
+                "type": "done",
+                "total": len(request.items),
+                "succeeded": succeeded,
+                "failed": len(request.items) - succeeded,
+                "elapsed_ms": int((datetime.now() - start).total_seconds() * 1000),
+            }
+        )
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
+@app.post("/playground/analyze-keywords", response_class=FastJSONResponse)
 async def analyze_keywords(request: dict):
     """
     Endpoint para análise e sugestão de palavras-chave
@@ -1032,8 +1291,13 @@ async def analyze_keywords(request: dict):
     {
         "transcript": "texto da transcrição",
         "keywords": ["palavra1", "palavra2"],  // opcional
-        "language": "pt"  // opcional
+        "language": "pt",  // opcional
+        "segments": [{"text", "start", "duration", "end"}]  // opcional
     }
+
+    Palavras-chave casam tokens inteiros (frases: tokens consecutivos). Com
+    "segments" (da resposta de /playground/transcribe), cada ocorrência
+    encontrada traz o início do seu segmento em segundos.
     """
     try:
         transcript = request.get("transcript", "")
@@ -1043,10 +1307,24 @@ async def analyze_keywords(request: dict):
         if not transcript:
             raise HTTPException(status_code=400, detail="Transcrição não fornecida")
 
-        result = playground_service.validate_keywords(keywords, transcript, language)
-        return result
+        segments = request.get("segments")
+        if segments:
+            if not isinstance(segments, list):
+                raise ValueError("segments deve ser uma lista de segmentos")
+            # model_validate: entrada inválida vira ValidationError (400), não TypeError
+            segments = [
+                TranscriptSegment.model_validate(segment).model_dump()
+                for segment in segments
+            ]
+
+        result = playground_service.validate_keywords(
+            keywords, transcript, language, segments=segments
+        )
+        return FastJSONResponse(result)
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks de Caminhos Críticos
+/-HALL-DEV Backend
+
+Executa em processo, sem rede. Uso:
+    python micro_benchmarks.py            # todos os benchmarks
+    python micro_benchmarks.py registry   # apenas um benchmark
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-sem-rede")
+
+import google.generativeai as genai
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from llm_service import extract_user_profile, llm_service
+from playground_service import CompactTranscript, chunk_boundaries, playground_service
+from schemas import (
+    ChatMessage,
+    ColumnarTranscribeResponse,
+    LLMRequest,
+    MessageRole,
+    TranscribeResponse,
+)
+
+# Mensagens típicas do chat (pt-BR) para benchmarks de extração
+CHAT_CORPUS = [
+    "Olá, bom dia!",
+    "Preciso de um site para minha loja",
+    "Meu nome é João Silva e trabalho na Acme Ltda",
+    "Quero automatizar o processo de faturamento que hoje é manual",
+    "Sou gerente de vendas na empresa XPTO",
+    "meu email é joao.silva@acme.com.br",
+    "Eu sou Maria, sou desenvolvedora e quero aprender machine learning",
+    "Quanto custa um dashboard de BI?",
+    "Me chamo Pedro. Trabalho como analista de dados",
+    "Não sei muito bem o que preciso, pode me orientar?",
+    "Temos dificuldade com relatórios, tudo é feito em planilhas",
+    "Pode me mandar o orçamento no email ana@empresa.com?",
+    "Meu cargo é Head de Marketing, minha empresa é Loja Azul",
+    "Gostaria de agendar uma reunião na próxima semana",
+    "Sou o diretor da empresa Hall Dev e queremos integrar nosso ERP",
+    "Prefiro explicações técnicas rápidas antes de agendar",
+    "eu sou desenvolvedor",
+    "Eu sou engenheiro de dados",
+    "eu sou muito curioso sobre IA",
+    "trabalho na Acme como gerente",
+    "Trabalho na Acme há 5 anos",
+    "trabalho na Loja Azul desde 2019",
+]
+
+# Saída esperada da extração de perfil (conferida no benchmark "profile")
+EXPECTED_PROFILES: dict[str, dict[str, str] | None] = {
+    "Meu nome é João Silva e trabalho na Acme Ltda": {
+        "name": "João Silva",
+        "company": "Acme Ltda",
+    },
+    "Sou gerente de vendas na empresa XPTO": {
+        "role": "gerente de vendas",
+        "company": "XPTO",
+    },
+    "Eu sou Maria, sou desenvolvedora e quero aprender machine learning": {
+        "name": "Maria",
+        "role": "desenvolvedora",
+    },
+    "Me chamo Pedro. Trabalho como analista de dados": {
+        "name": "Pedro",
+        "role": "analista de dados",
+    },
+    "eu sou desenvolvedor": {"role": "desenvolvedor"},
+    "Eu sou engenheiro de dados": {"role": "engenheiro de dados"},
+    "eu sou muito curioso sobre IA": None,
+    "trabalho na Acme como gerente": {"company": "Acme", "role": "gerente"},
+    "Trabalho na Acme há 5 anos": {"company": "Acme"},
+    "trabalho na Loja Azul desde 2019": {"company": "Loja Azul"},
+    "sou Ana da empresa X": {"name": "Ana", "company": "X"},
+    "sou dono de uma loja": {"role": "dono"},
+    "sou dono de empresa X": {"role": "dono", "company": "X"},
+}
+
+
+def timeit(func: Callable[[], object], iterations: int) -> float:
+    """Retorna o tempo médio por iteração em microssegundos"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+def bench_model_registry(iterations: int = 2000):
+    """Construção de GenerativeModel por requisição vs registro reutilizado"""
+    print("🧪 GenerativeModel: construção por requisição vs registro")
+
+    scenarios = [
+        (intent, ctx)
+        for intent in ["greeting", "mentoring", "help_request"]
+        for ctx in [
+            {"messages": [], "user_profile": {}},
+            {"messages": [{"role": "user"}], "user_profile": {}},
+            {
+                "messages": [{"role": "user"}],
+                "user_profile": {"name": "Ana", "email": "ana@exemplo.com"},
+            },
+        ]
+    ]
+
+    def per_request():
+        for intent, ctx in scenarios:
+            prompt = llm_service._get_contextual_prompt("", intent)
+            policy = llm_service._compose_policy_instructions(ctx, "")
+            genai.GenerativeModel(
+                llm_service.model_name,
+                system_instruction=f"{prompt}\n\nPOLÍTICA ATUAL (OBRIGATÓRIA): {policy}",
+            )
+
+    def pooled():
+        for intent, ctx in scenarios:
+            policy = llm_service._compose_policy_instructions(ctx, "")
+            llm_service.model_registry.get(
+                llm_service._get_prompt_variant(intent),
+                policy,
+                lambda intent=intent, policy=policy: (
+                    f"{llm_service._get_contextual_prompt('', intent)}"
+                    f"\n\nPOLÍTICA ATUAL (OBRIGATÓRIA): {policy}"
+                ),
+            )
+
+    baseline = timeit(per_request, iterations) / len(scenarios)
+    optimized = timeit(pooled, iterations) / len(scenarios)
+    print(f"   Por requisição: {baseline:8.2f} µs/modelo")
+    print(f"   Registro:       {optimized:8.2f} µs/modelo")
+    print(f"   Ganho:          {baseline / optimized:8.1f}x")
+    print(f"   Stats: {llm_service.model_registry.get_stats()}\n")
+
+
+def _legacy_extract_user_profile(message: str) -> dict[str, str] | None:
+    """Implementação anterior: regexes não compiladas, 4 padrões de nome + email"""
+    profile = {}
+    name_patterns = [
+        r"meu nome é\s+([\wÀ-ÖØ-öø-ÿ\s]{2,})",
+        r"eu sou\s+([\wÀ-ÖØ-öø-ÿ\s]{2,})",
+        r"chamo-me\s+([\wÀ-ÖØ-öø-ÿ\s]{2,})",
+        r"sou\s+([\wÀ-ÖØ-öø-ÿ\s]{2,})",
+    ]
+    for pattern in name_patterns:
+        match = re.search(pattern, message.lower())
+        if match:
+            profile["name"] = match.group(1).strip().title()
+            break
+    email_pattern = r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b"
+    email_match = re.search(email_pattern, message)
+    if email_match:
+        profile["email"] = email_match.group(0)
+    return profile if profile else None
+
+
+def bench_profile_extraction(iterations: int = 2000):
+    """Extração de perfil: regexes por chamada vs varredura única compilada"""
+    print("🧪 Extração de perfil (nome, email, empresa, cargo)")
+
+    def legacy():
+        for message in CHAT_CORPUS:
+            _legacy_extract_user_profile(message)
+
+    def compiled():
+        for message in CHAT_CORPUS:
+            extract_user_profile(message)
+
+    baseline = timeit(legacy, iterations) / len(CHAT_CORPUS)
+    optimized = timeit(compiled, iterations) / len(CHAT_CORPUS)
+    print(f"   Anterior (2 campos):  {baseline:8.2f} µs/mensagem")
+    print(f"   Compilada (4 campos): {optimized:8.2f} µs/mensagem")
+    print(f"   Razão:                {baseline / optimized:8.1f}x")
+    fields = sum(len(extract_user_profile(m) or {}) for m in CHAT_CORPUS)
+    legacy_fields = sum(len(_legacy_extract_user_profile(m) or {}) for m in CHAT_CORPUS)
+    print(f"   Campos extraídos no corpus: {legacy_fields} -> {fields}")
+    mismatches = [
+        (message, expected, extract_user_profile(message))
+        for message, expected in EXPECTED_PROFILES.items()
+        if extract_user_profile(message) != expected
+    ]
+    for message, expected, got in mismatches:
+        print(f"   ❌ {message!r}: esperado {expected}, obtido {got}")
+    if not mismatches:
+        print(f"   ✅ {len(EXPECTED_PROFILES)} extrações conferidas")
+    print()
+
+
+def bench_summary_cache_key(iterations: int = 500):
+    """Custo da chave de cache da sumarização em uma transcrição de 100k chars"""
+    print("🧪 Chave de cache da sumarização (transcrição de 100k caracteres)")
+
+    intro = "Olá pessoal, bem-vindos de volta ao canal! " * 12
+    transcript = (intro + "conteúdo específico do episódio " * 4000)[:100_000]
+    keywords = ["dados", "automação"]
+
+    def legacy():
+        content = f"{transcript[:500]}_{None}_{','.join(keywords)}"
+        hashlib.sha256(content.encode()).hexdigest()
+
+    def key_with(mode: str) -> Callable[[], str]:
+        def run():
+            playground_service.cache_key_mode = mode
+            return playground_service._get_cache_key(transcript, None, keywords)
+
+        return run
+
+    original_mode = playground_service.cache_key_mode
+    try:
+        results = {
+            "Anterior (sha256 dos 500 primeiros)": timeit(legacy, iterations),
+            "Conteúdo completo (blake2b)": timeit(key_with("full"), iterations),
+            "Fingerprint (tamanho+início+fim)": timeit(
+                key_with("fingerprint"), iterations
+            ),
+        }
+    finally:
+        playground_service.cache_key_mode = original_mode
+
+    for label, micros in results.items():
+        print(f"   {label:36s} {micros:9.2f} µs")
+    print("   (uma chamada ao Gemini leva segundos: ~1.000.000+ µs)\n")
+
+
+def _legacy_split_into_chunks(transcript: str, max_chunk_size: int) -> list[str]:
+    """Implementação anterior: concatenação repetida de strings"""
+    if len(transcript) <= max_chunk_size:
+        return [transcript]
+    sentences = transcript.split(". ")
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        test_chunk = current_chunk + sentence + ". "
+        if len(test_chunk) > max_chunk_size and current_chunk:
+            chunks.append(current_chunk.strip())
+            current_chunk = sentence + ". "
+        else:
+            current_chunk = test_chunk
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def bench_chunker():
+    """Chunking da transcrição: concatenação vs offsets em passada única"""
+    print("🧪 Chunking de transcrição (chunks de 15k caracteres)")
+    sentence = "Neste trecho falamos sobre automação de processos e dados. "
+    for size in (10_000, 100_000, 1_000_000):
+        text = (sentence * (size // len(sentence) + 1))[:size]
+        iterations = max(3, 2_000_000 // size)
+
+        legacy_chunks = _legacy_split_into_chunks(text, 15000)
+        new_chunks = chunk_boundaries(text, 15000)
+        baseline = timeit(
+            lambda text=text: _legacy_split_into_chunks(text, 15000), iterations
+        )
+        optimized = timeit(lambda text=text: chunk_boundaries(text, 15000), iterations)
+        print(
+            f"   {size:>9,} chars: anterior {baseline / 1000:8.2f} ms | "
+            f"offsets {optimized / 1000:8.2f} ms | "
+            f"{baseline / optimized:5.1f}x | chunks {len(legacy_chunks)} -> {len(new_chunks)}"
+        )
+    print()
+
+
+def _allocated_kib(build: Callable[[], object]) -> float:
+    """Memória alocada (KiB) para construir e manter o objeto retornado"""
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current / 1024
+
+
+def bench_transcript_repr():
+    """Transcrição: lista de dicts + TranscriptSegment vs representação colunar"""
+    print("🧪 Representação de transcrição (dicts por linha vs colunar compacta)")
+    for count in (1_000, 20_000):
+        segments = [
+            {
+                "text": f"legenda número {i} sobre automação de dados",
+                "start": i * 2.5,
+                "duration": 2.4,
+                "end": round(i * 2.5 + 2.4, 3),
+            }
+            for i in range(count)
+        ]
+        compact = CompactTranscript.from_segments(segments)
+        transcript = compact.text
+        base = {
+            "success": True,
+            "video_id": "abcdefghijk",
+            "video_url": "https://www.youtube.com/watch?v=abcdefghijk",
+            "transcript": transcript,
+            "language": "pt",
+            "duration": int(compact.end_time),
+            "word_count": len(transcript.split()),
+        }
+
+        dict_kib = _allocated_kib(compact.segments)
+        compact_kib = _allocated_kib(
+            lambda segments=segments: CompactTranscript.from_segments(segments)
+        )
+
+        def as_segments(compact=compact, base=base):
+            return TranscribeResponse(
+                **base, segments=compact.segments()
+            ).model_dump_json()
+
+        def as_columnar(compact=compact, base=base):
+            columns = compact.to_columnar()
+            return ColumnarTranscribeResponse(
+                **base,
+                segment_offsets=columns["offsets"],
+                segment_starts=columns["starts"],
+                segment_durations=columns["durations"],
+            ).model_dump_json()
+
+        iterations = max(3, 200_000 // count)
+        baseline = timeit(as_segments, iterations)
+        optimized = timeit(as_columnar, iterations)
+        print(
+            f"   {count:>6,} segmentos: memória {dict_kib:9.1f} KiB -> {compact_kib:8.1f} KiB | "
+            f"serialização {baseline / 1000:7.2f} ms -> {optimized / 1000:6.2f} ms "
+            f"({baseline / optimized:4.1f}x) | JSON {len(as_segments()):,} -> {len(as_columnar()):,} bytes"
+        )
+    print()
+
+
+def bench_response_serialization():
+    """Resposta de /playground/transcribe: caminho padrão do FastAPI vs FastJSONResponse"""
+    from main import FastJSONResponse  # importa a app só para este benchmark
+
+    print("🧪 Serialização da resposta de transcrição por número de segmentos")
+    field = create_model_field(
+        "Response_transcribe", TranscribeResponse, mode="serialization"
+    )
+    loop = asyncio.new_event_loop()
+    try:
+        for count in (100, 1_000, 5_000, 20_000):
+            compact = CompactTranscript.from_segments(
+                [
+                    {
+                        "text": f"legenda {i} sobre dados",
+                        "start": i * 2.5,
+                        "duration": 2.4,
+                    }
+                    for i in range(count)
+                ]
+            )
+            result = {
+                "video_id": "abcdefghijk",
+                "video_url": "https://www.youtube.com/watch?v=abcdefghijk",
+                "transcript": compact.text,
+                "language": "pt",
+                "duration": int(compact.end_time),
+                "title": None,
+            }
+
+            def default_path(compact=compact, result=result):
+                model = TranscribeResponse(**result, segments=compact.segments())
+                content = loop.run_until_complete(
+                    serialize_response(field=field, response_content=model)
+                )
+                return JSONResponse(content).body
+
+            def fast_path(compact=compact, result=result):
+                return FastJSONResponse({**result, "segments": compact.segments()}).body
+
+            iterations = max(3, 100_000 // count)
+            baseline = timeit(default_path, iterations)
+            optimized = timeit(fast_path, iterations)
+            print(
+                f"   {count:>6,} segmentos: padrão {baseline / 1000:8.2f} ms | "
+                f"FastJSONResponse {optimized / 1000:7.2f} ms | {baseline / optimized:5.1f}x"
+            )
+    finally:
+        loop.close()
+    print()
+
+
+def _legacy_validate_keywords(keywords: list[str], transcript: str) -> dict:
+    """Implementação anterior: `in` + count por keyword e regex não compilada"""
+    transcript_lower = transcript.lower()
+    found = [
+        {"keyword": kw, "count": transcript_lower.count(kw.lower())}
+        for kw in keywords
+        if kw.lower() in transcript_lower
+    ]
+    stop_words = playground_service._get_stop_words("pt")
+    word_count: dict[str, int] = {}
+    for word in re.findall(r"\b[a-zA-ZÀ-ÿ]{3,}\b", transcript.lower()):
+        if word not in stop_words:
+            word_count[word] = word_count.get(word, 0) + 1
+    sorted_words = sorted(word_count.items(), key=lambda x: x[1], reverse=True)
+    return {"found": found, "suggestions": [w for w, c in sorted_words[:10] if c >= 2]}
+
+
+def bench_keyword_index(iterations: int = 50):
+    """Análise de palavras-chave: varreduras por keyword vs índice invertido"""
+    print("🧪 Análise de palavras-chave (transcrição de 100k caracteres)")
+    vocabulary = "automação dados processo cliente venda relatório planilha sistema"
+    words = vocabulary.split()
+    transcript = " ".join(
+        f"{words[i % len(words)]} exemplo{i % 97} número {i}" for i in range(6000)
+    )[:100_000]
+    for count in (5, 50):
+        keywords = [f"{words[i % len(words)]} exemplo{i % 97}" for i in range(count)]
+
+        def indexed(keywords=keywords):
+            return playground_service.validate_keywords(keywords, transcript, "pt")
+
+        def cold(keywords=keywords):
+            playground_service._keyword_index_memo.clear()
+            return indexed(keywords)
+
+        baseline = timeit(
+            lambda k=keywords: _legacy_validate_keywords(k, transcript), iterations
+        )
+        first = timeit(cold, iterations)
+        warm = timeit(indexed, iterations)
+        print(
+            f"   {count:>3} keywords: anterior {baseline / 1000:7.2f} ms | "
+            f"índice (construção) {first / 1000:7.2f} ms | "
+            f"índice em cache {warm / 1000:6.2f} ms ({baseline / warm:5.1f}x)"
+        )
+    print()
+
+
+def bench_context_window(turns: int = 200):
+    """Janela de contexto: custo por turno e mensagem atual fora do histórico"""
+    print("🧪 Janela de contexto (sessão longa com texto colado)")
+    pasted = "texto colado de um documento enorme " * 700  # ~25k caracteres
+    messages: list[ChatMessage] = []
+    duplicated = 0
+    elapsed = 0.0
+    for turn in range(turns):
+        content = pasted if turn % 50 == 10 else f"pergunta {turn} sobre o projeto " * 8
+        messages.append(ChatMessage(role=MessageRole.USER, content=content))
+        request = LLMRequest(
+            session_id="benchmark-window",
+            message=content,
+            context={"messages": messages},
+        )
+        start = time.perf_counter()
+        history, _ = llm_service._prepare_context(request)
+        elapsed += time.perf_counter() - start
+        # A mensagem atual vai à parte no send_message: nunca no histórico
+        if any(content[:200] in entry["content"] for entry in history[-1:]):
+            duplicated += 1
+        messages.append(
+            ChatMessage(role=MessageRole.ASSISTANT, content=f"resposta {turn}")
+        )
+    llm_service.release_session("benchmark-window")
+
+    status = "✅" if duplicated == 0 else "❌"
+    print(f"   Custo médio por turno: {elapsed / turns * 1_000_000:8.2f} µs")
+    print(f"   {status} Turnos com a mensagem atual no histórico: {duplicated}\n")
+
+
+BENCHMARKS: dict[str, Callable[[], None]] = {
+    "registry": bench_model_registry,
+    "profile": bench_profile_extraction,
+    "summary_key": bench_summary_cache_key,
+    "chunker": bench_chunker,
+    "transcript_repr": bench_transcript_repr,
+    "response_json": bench_response_serialization,
+    "keywords": bench_keyword_index,
+    "window": bench_context_window,
+}
+
+
+def main():
+    """Executa os benchmarks selecionados"""
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        if name not in BENCHMARKS:
+            print(
+                f"❌ Benchmark desconhecido: {name} (disponíveis: {', '.join(BENCHMARKS)})"
+            )
+            continue
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
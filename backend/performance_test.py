@@ -25,6 +25,10 @@ API_BASE_URL = "http://localhost:8000"
 CONCURRENT_USERS = 3  # Reduzido de 10 para 3
 REQUESTS_PER_USER = 2  # Reduzido de 5 para 2
 TEST_DURATION = 30  # Reduzido de 60 para 30 segundos
+# Chats simultâneos no teste de sobreposição. Todos saem do mesmo IP: rode o
+# servidor com LLM_RATE_LIMIT_BURST >= OVERLAP_CHATS (e o burst global também),
+# senão parte das mensagens recebe 429 (contabilizadas e reportadas no teste).
+OVERLAP_CHATS = 8
 
 
 class PerformanceTest:
@@ -185,6 +189,107 @@ class PerformanceTest:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    async def test_concurrent_chat_overlap(self) -> dict:
+        """
+        Testa se chats simultâneos se sobrepõem em vez de enfileirar
+
+        Dispara OVERLAP_CHATS mensagens ao mesmo tempo e, em paralelo, mede o
+        /health. Se as chamadas ao Gemini bloqueassem o event loop, o tempo
+        total seria próximo da soma das latências (fator de sobreposição ~1)
+        e o /health ficaria preso atrás delas.
+        """
+        print("🔀 Testando sobreposição de chats concorrentes...")
+
+        def start_session(index: int) -> str | None:
+            response = requests.post(
+                f"{API_BASE_URL}/chat/start",
+                json={"user_id": f"overlap_user_{index}"},
+                timeout=10,
+            )
+            if response.status_code != 200:
+                return None
+            return response.json()["session_id"]
+
+        def send_message(session_id: str, index: int) -> tuple[float | None, int]:
+            start = time.time()
+            response = requests.post(
+                f"{API_BASE_URL}/chat/message",
+                json={
+                    "session_id": session_id,
+                    # Mensagens distintas para não acertar o cache
+                    "message": f"Preciso automatizar o processo {index} da empresa",
+                },
+                timeout=60,
+            )
+            if response.status_code != 200:
+                return None, response.status_code
+            return time.time() - start, response.status_code
+
+        sessions = await asyncio.gather(
+            *(asyncio.to_thread(start_session, i) for i in range(OVERLAP_CHATS))
+        )
+        sessions = [s for s in sessions if s]
+        if not sessions:
+            return {"error": "Failed to start chats for overlap test"}
+
+        health_latencies: list[float] = []
+        chats_done = asyncio.Event()
+
+        async def probe_health():
+            while not chats_done.is_set():
+                start = time.time()
+                await asyncio.to_thread(
+                    requests.get, f"{API_BASE_URL}/health", timeout=10
+                )
+                health_latencies.append(time.time() - start)
+                await asyncio.sleep(0.1)
+
+        probe = asyncio.create_task(probe_health())
+        wall_start = time.time()
+        outcomes = await asyncio.gather(
+            *(
+                asyncio.to_thread(send_message, session_id, i)
+                for i, session_id in enumerate(sessions)
+            )
+        )
+        wall_time = time.time() - wall_start
+        chats_done.set()
+        await probe
+
+        latencies = [t for t, _ in outcomes if t is not None]
+        rate_limited = sum(1 for _, status in outcomes if status == 429)
+        if rate_limited:
+            # Mensagens rejeitadas não se sobrepõem: o fator fica subestimado
+            print(
+                f"⚠️ {rate_limited}/{len(sessions)} mensagens receberam 429: rode o "
+                "servidor com LLM_RATE_LIMIT_BURST e LLM_GLOBAL_RATE_LIMIT_BURST "
+                f">= {OVERLAP_CHATS}"
+            )
+        if not latencies:
+            return {
+                "error": "Nenhuma mensagem concorrente bem-sucedida",
+                "rate_limited": rate_limited,
+            }
+
+        for session_id in sessions:
+            requests.post(
+                f"{API_BASE_URL}/chat/end",
+                json={"session_id": session_id, "reason": "overlap_test"},
+                timeout=5,
+            )
+
+        return {
+            "concurrent_chats": len(sessions),
+            "successful_messages": len(latencies),
+            "rate_limited": rate_limited,
+            "wall_time": wall_time,
+            "sum_latencies": sum(latencies),
+            "max_latency": max(latencies),
+            # ~1.0 = enfileirado; ~N = N chats sobrepostos
+            "overlap_factor": sum(latencies) / wall_time if wall_time > 0 else 0,
+            "health_max_latency": max(health_latencies) if health_latencies else 0,
+        }
+
     async def test_cache_performance(self) -> dict:
         """Testa performance do cache"""
         print("💾 Testando performance do cache...")
@@ -290,7 +395,21 @@ class PerformanceTest:
         )
         print(f"   Throughput: {concurrent_result['throughput']:.2f} sessões/segundo")
 
-        # Teste 3: Performance do cache
+        # Teste 3: Sobreposição de chats concorrentes
+        print("\n🔀 Testando sobreposição de chats concorrentes...")
+        overlap_result = await self.test_concurrent_chat_overlap()
+        self.results["chat_overlap"] = overlap_result
+
+        if "error" in overlap_result:
+            print(f"❌ Sobreposição: {overlap_result['error']}")
+        else:
+            print(
+                f"✅ Sobreposição: fator {overlap_result['overlap_factor']:.2f} "
+                f"({overlap_result['concurrent_chats']} chats em "
+                f"{overlap_result['wall_time']:.2f}s)"
+            )
+
+        # Teste 4: Performance do cache
         print("\n💾 Testando performance do cache...")
         cache_result = await self.test_cache_performance()
         self.results["cache_performance"] = cache_result
@@ -342,6 +461,17 @@ class PerformanceTest:
             print(f"  Taxa de sucesso: {cl['success_rate'] * 100:.1f}%")
             print(f"  Throughput: {cl['throughput']:.2f} sessões/segundo")
 
+        # Resumo da sobreposição de chats
+        if "chat_overlap" in self.results and "error" not in self.results["chat_overlap"]:
+            co = self.results["chat_overlap"]
+            print("\nSobreposição de Chats:")
+            print(f"  Chats simultâneos: {co['concurrent_chats']}")
+            print(f"  Mensagens com sucesso: {co['successful_messages']}")
+            if co["rate_limited"]:
+                print(f"  ⚠️ Rejeitadas por rate limit (429): {co['rate_limited']}")
+            print(f"  Fator de sobreposição: {co['overlap_factor']:.2f}")
+            print(f"  Latência máxima do /health: {co['health_max_latency']:.3f}s")
+
         # Resumo do cache
         if (
             "cache_performance" in self.results
@@ -6,11 +6,12 @@ Teste Rápido de Performance e Funcionalidades
 
 import asyncio
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 from chat_manager import chat_manager
 from database import db_manager
-from llm_service import llm_service
+from llm_service import LLMCache, llm_service
 
 
 async def test_timeout_system():
@@ -173,6 +174,55 @@ async def test_llm_personality():
     print("🎯 Teste de personalidade concluído!\n")
 
 
+async def test_cache_hot_key_concurrency():
+    """Testa leituras concorrentes de uma mesma chave quente do cache"""
+    print("🧪 Testando concorrência em chave quente do cache...")
+
+    from schemas import LLMResponse
+
+    cache = LLMCache(max_size=10, ttl_hours=1)
+    original = LLMResponse(
+        message="Resposta compartilhada",
+        session_id="origem",
+        confidence=0.8,
+        metadata={"cached": False},
+    )
+    cache.set("hot", original)
+
+    def hammer(worker: int) -> int:
+        shared = 0
+        for i in range(500):
+            response = cache.get("hot")
+            if response is original:
+                shared += 1
+            # Simula o que generate_response faz em um cache hit
+            response.session_id = f"worker_{worker}_{i}"
+            response.metadata = {**response.metadata, "cache_hit": True}
+        return shared
+
+    workers = 32
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = await asyncio.gather(
+            *(loop.run_in_executor(executor, hammer, w) for w in range(workers))
+        )
+
+    # A entrada armazenada não pode ter sido alterada por nenhuma leitura
+    stored = cache.get("hot")
+    if stored.session_id == "origem" and stored.metadata == {"cached": False}:
+        print("✅ Entrada do cache permaneceu intacta")
+    else:
+        print(f"❌ Entrada do cache foi corrompida: {stored}")
+
+    # Nenhuma leitura deve devolver o objeto armazenado originalmente
+    if sum(results) == 0 and original.session_id == "origem":
+        print(f"✅ {workers * 500} leituras concorrentes sem objeto compartilhado")
+    else:
+        print("❌ Leituras concorrentes compartilharam o objeto original")
+
+    print("🎯 Teste de concorrência do cache concluído!\n")
+
+
 async def main():
     """Executa todos os testes"""
     print("🚀 Iniciando testes de funcionalidades...\n")
@@ -184,6 +234,7 @@ async def main():
     await test_conversation_summary()
     await test_lead_with_email()
     await test_llm_personality()
+    await test_cache_hot_key_concurrency()
 
     end_time = time.time()
     duration = end_time - start_time
@@ -7,7 +7,7 @@ from datetime import datetime
 from enum import Enum
 from typing import Any
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, PrivateAttr
 
 
 class MessageRole(str, Enum):
@@ -26,6 +26,10 @@ class ChatMessage(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.now)
     metadata: dict[str, Any] | None = None
 
+    # Intenção memorizada (ver LLMService.get_message_intent)
+    _intent: str | None = PrivateAttr(default=None)
+    _intent_computed: bool = PrivateAttr(default=False)
+
 
 class Phase(str, Enum):
     """Fases do fluxo de conversa"""
@@ -124,6 +128,13 @@ class LeadData(BaseModel):
 # === SCHEMAS PARA PLAYGROUND DE TRANSCRIÇÃO YOUTUBE ===
 
 
+class TranscriptFormat(str, Enum):
+    """Formato dos segmentos na resposta de transcrição"""
+
+    SEGMENTS = "segments"
+    COLUMNAR = "columnar"
+
+
 class TranscribeRequest(BaseModel):
     """Schema para requisição de transcrição de vídeo do YouTube"""
 
@@ -132,6 +143,10 @@ class TranscribeRequest(BaseModel):
         description="URL completa do vídeo do YouTube",
         examples=["https://www.youtube.com/watch?v=dQw4w9WgXcQ"],
     )
+    format: TranscriptFormat = Field(
+        TranscriptFormat.SEGMENTS,
+        description="segments: lista de objetos; columnar: arrays paralelos (compacto)",
+    )
 
 
 class TranscriptSegment(BaseModel):
@@ -148,6 +163,12 @@ class KeywordAnalysis(BaseModel):
 
     keyword: str = Field(..., description="Palavra-chave analisada")
     count: int = Field(..., description="Número de ocorrências na transcrição")
+    positions: list[int] = Field(
+        default_factory=list, description="Offsets das ocorrências na transcrição"
+    )
+    timestamps: list[float] | None = Field(
+        None, description="Início (s) do segmento de cada ocorrência, se enviados"
+    )
 
 
 class KeywordValidationResponse(BaseModel):
@@ -170,6 +191,36 @@ class TranscribeResponse(BaseModel):
     segments: list[TranscriptSegment] = Field(..., description="Segmentos da transcrição com timestamps")
 
 
+class ColumnarTranscribeResponse(BaseModel):
+    """
+    Resposta de transcrição em formato colunar
+
+    O texto do segmento i é transcript[segment_offsets[i]:segment_offsets[i + 1] - 1]
+    e seu fim é segment_starts[i] + segment_durations[i].
+    """
+
+    video_id: str = Field(..., description="ID do vídeo do YouTube")
+    video_url: str = Field(..., description="URL do vídeo")
+    title: str | None = Field(None, description="Título do vídeo")
+    transcript: str = Field(..., description="Transcrição completa do vídeo")
+    language: str = Field(..., description="Idioma da transcrição")
+    duration: int | None = Field(None, description="Duração do vídeo em segundos")
+    format: TranscriptFormat = Field(TranscriptFormat.COLUMNAR, description="Formato")
+    segment_offsets: list[int] = Field(
+        ..., description="Offsets dos segmentos em transcript (n + 1 valores)"
+    )
+    segment_starts: list[float] = Field(..., description="Início de cada segmento (s)")
+    segment_durations: list[float] = Field(..., description="Duração de cada segmento (s)")
+
+
+class SummarizeMode(str, Enum):
+    """Estratégia para transcrições longas"""
+
+    AUTO = "auto"
+    TRUNCATE = "truncate"
+    MAP_REDUCE = "map_reduce"
+
+
 class SummarizeRequest(BaseModel):
     """Schema para requisição de sumarização"""
 
@@ -180,6 +231,14 @@ class SummarizeRequest(BaseModel):
     keywords: list[str] | None = Field(
         None, description="Lista de palavras-chave para destacar"
     )
+    mode: SummarizeMode = Field(
+        SummarizeMode.AUTO,
+        description="auto: map-reduce só quando a transcrição seria truncada",
+    )
+    segments: list[TranscriptSegment] | None = Field(
+        None,
+        description="Segmentos com timestamps: chunking por tempo e citações [mm:ss]",
+    )
 
 
 class SummarySection(BaseModel):
@@ -189,6 +248,13 @@ class SummarySection(BaseModel):
     content: str = Field(..., description="Conteúdo da seção")
 
 
+class ChunkTimestamp(BaseModel):
+    """Intervalo do vídeo coberto por um chunk sumarizado"""
+
+    start: float = Field(..., description="Início do chunk em segundos")
+    end: float = Field(..., description="Fim do chunk em segundos")
+
+
 class SummarizeResponse(BaseModel):
     """Schema para resposta de sumarização"""
 
@@ -204,3 +270,19 @@ class SummarizeResponse(BaseModel):
         ge=0.0, le=1.0, description="Confiança na qualidade da sumarização"
     )
     was_truncated: bool = Field(False, description="Indica se a transcrição foi cortada")
+    mode: str = Field("single", description="single ou map_reduce")
+    chunk_count: int = Field(1, description="Chunks resumidos no modo map-reduce")
+    chunk_timestamps: list[ChunkTimestamp] | None = Field(
+        None, description="Intervalos de tempo dos chunks (quando há segmentos)"
+    )
+
+
+class BatchSummarizeRequest(BaseModel):
+    """Schema para sumarização em lote (ex.: playlist)"""
+
+    items: list[SummarizeRequest] = Field(
+        ..., min_length=1, max_length=50, description="Transcrições a sumarizar"
+    )
+    max_concurrency: int | None = Field(
+        None, ge=1, le=10, description="Sumarizações simultâneas (padrão do servidor)"
+    )
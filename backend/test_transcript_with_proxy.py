@@ -25,7 +25,7 @@ try:
     print(f"Video ID: {result['video_id']}")
     print(f"Idioma: {result['language']}")
     print(f"Duração: {result['duration']}s")
-    print(f"Segmentos: {len(result['segments'])}")
+    print(f"Segmentos: {len(result['compact'])}")
     print(f"Primeiros 200 chars: {result['transcript'][:200]}...")
     
 except Exception as e: